@@ -0,0 +1,112 @@
+import os
+import sys
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import discord
+import safe14
+
+# =========================
+# 재생 방식별 스트림당 CPU 사용량
+# pcm  : FFmpegPCMAudio + PCMVolumeTransformer + 파이썬에서 Opus 인코딩 (VoiceClient 가 하는 일)
+# opus : FFmpegOpusAudio, ffmpeg 이 volume 필터 + Opus 인코딩
+# copy : FFmpegOpusAudio, Opus 원본을 재인코딩 없이 복사 (volume 1.0 일 때)
+# 로컬 파일을 스트림 N 개로 동시에 읽으면서 봇 프로세스 + ffmpeg 자식 프로세스 CPU 시간을 잼
+# 예) python bot-run/bench/bench_audio_cpu.py --guilds 1 10 50 --seconds 10
+#     (ffmpeg 이 PATH 에 없으면 --ffmpeg, libopus 를 못 찾으면 --opus-lib, ffmpeg 경고는 2>/dev/null)
+# =========================
+
+def cpu_time():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime, children.ru_utime + children.ru_stime
+
+def make_input(ffmpeg, path, seconds):
+    # 유튜브 bestaudio 와 비슷한 Opus/WebM 파일
+    subprocess.run(
+        [
+            ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+            "-ac", "2", "-ar", "48000", "-c:a", "libopus", "-b:a", "128k", path
+        ],
+        check=True
+    )
+
+def make_source(mode, data):
+    if mode == "pcm":
+        pcm = discord.FFmpegPCMAudio(data["url"], **safe14.ffmpeg_source_opts())
+        return safe14.YTDLSource(pcm, data=data)
+    if mode == "opus":
+        return safe14.YTDLOpusSource(data)
+    return safe14.YTDLOpusSource(data, volume=1.0)
+
+def run(mode, guilds, frames, data, encoder):
+    own_before, child_before = cpu_time()
+    sources = [make_source(mode, data) for _ in range(guilds)]
+    started = time.perf_counter()
+
+    # 음성 스레드처럼 스트림마다 20ms 프레임을 차례로 읽음 (실시간 대기 없이)
+    read = 0
+    for _ in range(frames):
+        for source in sources:
+            frame = source.read()
+            if not frame:
+                continue
+            read += 1
+            if not source.is_opus():
+                encoder.encode(frame, encoder.SAMPLES_PER_FRAME)
+
+    if read < frames * guilds:
+        print(f"⚠️ {mode}: 프레임 {read}/{frames * guilds} 개만 읽힘")
+
+    elapsed = time.perf_counter() - started
+    for source in sources:
+        source.cleanup()
+    own_after, child_after = cpu_time()
+
+    audio_seconds = frames * 0.02
+    own = (own_after - own_before) / guilds / audio_seconds
+    child = (child_after - child_before) / guilds / audio_seconds
+    return own, child, elapsed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--guilds", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--seconds", type=int, default=10, help="스트림마다 처리할 오디오 길이(초)")
+    parser.add_argument("--modes", nargs="+", default=["pcm", "opus", "copy"])
+    parser.add_argument("--ffmpeg", default="ffmpeg")
+    parser.add_argument("--opus-lib", default=None)
+    args = parser.parse_args()
+
+    if args.opus_lib:
+        discord.opus.load_opus(args.opus_lib)
+    encoder = discord.opus.Encoder() if "pcm" in args.modes else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # safe14 의 소스들은 실행 파일 이름 "ffmpeg" 를 쓰므로 PATH 앞에 링크를 둠
+        if args.ffmpeg != "ffmpeg":
+            os.symlink(os.path.abspath(args.ffmpeg), os.path.join(tmp, "ffmpeg"))
+            os.environ["PATH"] = tmp + os.pathsep + os.environ["PATH"]
+
+        path = os.path.join(tmp, "input.webm")
+        make_input("ffmpeg", path, args.seconds + 1)
+        data = {"url": path, "acodec": "opus", "title": "bench", "duration": args.seconds}
+
+        # 로컬 파일에는 -reconnect 옵션을 쓸 수 없음
+        safe14.ffmpeg_opts["before_options"] = ""
+
+        print("CPU 사용량 = 실시간 1초 재생당 CPU 초 (100% = 코어 하나)")
+        for guilds in args.guilds:
+            for mode in args.modes:
+                own, child, elapsed = run(mode, guilds, args.seconds * 50, data, encoder)
+                print(
+                    f"guilds {guilds:3}  {mode:4}: 봇 {own * 100:6.2f}%  ffmpeg {child * 100:6.2f}%  "
+                    f"합계 {(own + child) * 100:6.2f}% / stream  ({elapsed:.1f}s)"
+                )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import safe14
+
+# =========================
+# 추출 중 event loop 지연 비교 (thread 모드 vs process 모드)
+# 기본은 yt-dlp 의 JSON/정규식 파싱을 흉내 낸 CPU 작업 (네트워크 없이 재현 가능)
+# --query 를 주면 실제 YTDLExtractor 로 추출 (네트워크 필요)
+# 예) python bot-run/bench/bench_extract_lag.py --jobs 40 --workers 4
+#     python bot-run/bench/bench_extract_lag.py --query "never gonna give you up" --jobs 8
+# =========================
+PLAYER_RESPONSE = json.dumps({
+    "streamingData": {
+        "adaptiveFormats": [
+            {"itag": i, "url": f"https://example.invalid/videoplayback?expire=1&sig={'x' * 200}&i={i}",
+             "mimeType": 'audio/webm; codecs="opus"', "bitrate": 128000 + i}
+            for i in range(400)
+        ]
+    },
+    "videoDetails": {"title": "t" * 200, "shortDescription": "d" * 5000},
+})
+SIG_RE = re.compile(r"sig=([a-z]+)&i=(\d+)")
+
+def warm_up(seconds):
+    time.sleep(seconds)
+
+def synthetic_extract(rounds):
+    # yt-dlp 한 번 추출할 때의 순수 파이썬 파싱 부하 대용
+    found = 0
+    for _ in range(rounds):
+        data = json.loads(PLAYER_RESPONSE)
+        for fmt in data["streamingData"]["adaptiveFormats"]:
+            found += len(SIG_RE.findall(fmt["url"]))
+    return found
+
+async def sentinel(samples, stop, interval=0.005):
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - expected))
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+async def run_mode(mode, args):
+    samples = []
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(sentinel(samples, stop))
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+
+    if args.query:
+        extractor = safe14.YTDLExtractor(mode=mode, workers=args.workers)
+        extractor.start()
+        await asyncio.sleep(1)  # 워커 준비
+        samples.clear()
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(extractor.extract(f"ytsearch1:{args.query} {i}") for i in range(args.jobs)),
+            return_exceptions=True
+        )
+        failed = sum(isinstance(r, Exception) for r in results)
+        executor = extractor
+    else:
+        if mode == "process":
+            executor = ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn"))
+            # 워커 프로세스를 전부 미리 띄워 둠 (놀고 있는 워커가 있으면 새로 안 띄우므로 잠깐씩 붙잡음)
+            await asyncio.gather(*(loop.run_in_executor(executor, warm_up, 0.5) for _ in range(args.workers)))
+        else:
+            executor = ThreadPoolExecutor(args.workers)
+        samples.clear()
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(loop.run_in_executor(executor, synthetic_extract, args.rounds) for _ in range(args.jobs))
+        )
+        failed = 0
+
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await watcher
+    # 워커 정리(join)는 loop 를 막으므로 측정이 끝난 뒤에
+    executor.shutdown()
+    return elapsed, samples, failed
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=20, help="합성 작업 하나당 파싱 횟수")
+    parser.add_argument("--query", default=None)
+    args = parser.parse_args()
+
+    print(f"작업 {args.jobs}개, 워커 {args.workers}개, {'실제 추출' if args.query else '합성 파싱 부하'}")
+    for mode in ("thread", "process"):
+        elapsed, samples, failed = asyncio.run(run_mode(mode, args))
+        print(
+            f"{mode:7}: {elapsed:6.2f}s  loop lag p50 {percentile(samples, 0.5) * 1000:6.1f}ms  "
+            f"p99 {percentile(samples, 0.99) * 1000:6.1f}ms  max {max(samples or [0]) * 1000:6.1f}ms"
+            + (f"  (실패 {failed})" if failed else "")
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import safe14
+
+# =========================
+# 전용채널 확인 처리량 비교 (메시지/초)
+# before: 메시지마다 music_channels.json 을 열어서 json.load
+# after : MusicChannelRegistry 메모리 조회
+# 예) python bot-run/bench/bench_music_channels.py --messages 50000 --channels 2000
+# =========================
+
+def make_messages(count, channel_ids, hit_ratio):
+    # 대부분은 전용채널이 아닌 일반 채팅 (hit_ratio 만큼만 전용채널)
+    hits = max(1, int(count * hit_ratio))
+    messages = []
+    for i in range(count):
+        channel_id = channel_ids[i % len(channel_ids)] if i < hits else 10**17 + i
+        messages.append(SimpleNamespace(
+            author=SimpleNamespace(bot=False),
+            channel=SimpleNamespace(id=channel_id),
+            content=""
+        ))
+    return messages
+
+def on_message_before(path):
+    # 예전 방식: 메시지마다 파일을 읽음
+    async def handler(message):
+        if message.author.bot:
+            return False
+        return message.channel.id in safe14.load_music_channels(path)
+    return handler
+
+def on_message_after(registry):
+    async def handler(message):
+        if message.author.bot:
+            return False
+        return message.channel.id in registry
+    return handler
+
+async def run(handler, messages):
+    started = time.perf_counter()
+    for message in messages:
+        await handler(message)
+    return len(messages) / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--channels", type=int, default=1000, help="파일에 들어 있는 전용채널 수")
+    parser.add_argument("--hit-ratio", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "music_channels.json")
+        channel_ids = [10**17 + 10**9 + i for i in range(args.channels)]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"music_channels": channel_ids}, f)
+
+        registry = safe14.MusicChannelRegistry(path)
+        messages = make_messages(args.messages, channel_ids, args.hit_ratio)
+
+        before = asyncio.run(run(on_message_before(path), messages))
+        after = asyncio.run(run(on_message_after(registry), messages))
+
+    print(f"메시지 {args.messages}개, 전용채널 {args.channels}개")
+    print(f"before (파일 읽기): {before:12,.0f} msg/s")
+    print(f"after  (registry) : {after:12,.0f} msg/s  (x{after / before:,.0f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import os
+import sys
+import argparse
+import tracemalloc
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import safe14
+
+# =========================
+# 대기곡 한 개당 메모리 (tracemalloc 기준)
+# before: {"query", "requester": Member, "channel": TextChannel} dict
+# after : ID 만 들고 있는 QueueEntry (__slots__)
+# 예) python bot-run/bench/bench_queue_memory.py --items 10000 --guilds 100
+# =========================
+
+class FakeObject:
+    # Member/TextChannel 대신 (dict 쪽은 참조만 잡고 있으므로 크기는 측정에 안 들어감)
+    pass
+
+def queries(count):
+    # 검색어 문자열은 양쪽이 같으므로 미리 만들어 둠
+    return [f"artist {i % 500} - song {i}" for i in range(count)]
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    queues = build()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return queues, size
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--guilds", type=int, default=100)
+    args = parser.parse_args()
+
+    texts = queries(args.items)
+    members = [FakeObject() for _ in range(args.guilds)]
+    channels = [FakeObject() for _ in range(args.guilds)]
+
+    def build_dicts():
+        queues = {guild_id: deque() for guild_id in range(args.guilds)}
+        for i, query in enumerate(texts):
+            guild_id = i % args.guilds
+            queues[guild_id].append({
+                "query": query,
+                "requester": members[guild_id],
+                "channel": channels[guild_id],
+            })
+        return queues
+
+    def build_entries():
+        queues = {
+            guild_id: safe14.GuildQueue(guild_id, max_size=args.items, user_limit=0)
+            for guild_id in range(args.guilds)
+        }
+        for i, query in enumerate(texts):
+            guild_id = i % args.guilds
+            queues[guild_id].push(safe14.QueueEntry(
+                10**17 + guild_id, 10**17 + 10**6 + guild_id, 10**17 + 2 * 10**6 + guild_id, query
+            ))
+        return queues
+
+    _, dict_size = measure(build_dicts)
+    _, entry_size = measure(build_entries)
+
+    print(f"대기곡 {args.items}개 / 서버 {args.guilds}개")
+    print(f"dict + 객체 참조 : {dict_size / args.items:7.1f} bytes/item (Member/Channel 객체 자체는 별도로 붙잡힘)")
+    print(f"QueueEntry       : {entry_size / args.items:7.1f} bytes/item (ID 정수 포함)")
+
+if __name__ == "__main__":
+    main()
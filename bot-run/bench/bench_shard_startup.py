@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+import yarl
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import discord
+from discord.ext import commands
+import safe14
+
+# =========================
+# 가짜 Discord gateway 로 AutoShardedBot 시작 시간 측정
+# REST 는 /users/@me, /oauth2/applications/@me, /gateway/bot 만, gateway 는 HELLO → READY (unavailable 길드) → 길드마다 GUILD_CREATE, heartbeat ACK
+# sent = 서버가 마지막 GUILD_CREATE 를 보낸 시점, on_ready = 마지막 GUILD_CREATE 까지 + guild_ready_timeout (기본 2초, 샤드끼리는 동시에 기다림)
+# 실제 Discord 는 IDENTIFY 사이에 5초를 기다림 (max_concurrency 1), --identify-delay 5 로 재현 가능
+# (safe14 가 import 때 --shards 를 읽어서 옵션 이름을 다르게 둠)
+# 예) python bot-run/bench/bench_shard_startup.py --shard-counts 1,2,4,8 --guild-counts 1000,5000
+# =========================
+BOT_ID = 100000000000000000
+
+def guild_ids(shard_id, shard_count, count):
+    # (guild_id >> 22) % shard_count == shard_id 인 길드 id 만 만들어서 해당 샤드로 보냄
+    return [((k * shard_count + shard_id + 1) << 22) for k in range(count)]
+
+def guild_payload(guild_id):
+    return {
+        "id": str(guild_id),
+        "name": f"guild-{guild_id}",
+        "owner_id": str(BOT_ID),
+        "member_count": 50,
+        "large": False,
+        "unavailable": False,
+        "features": [],
+        "roles": [],
+        "emojis": [],
+        "stickers": [],
+        "channels": [],
+        "threads": [],
+        "members": [],
+        "voice_states": [],
+        "presences": [],
+        "stage_instances": [],
+        "guild_scheduled_events": [],
+    }
+
+def json_response(data):
+    # discord.py 는 Content-Type 이 정확히 application/json 일 때만 JSON 으로 읽음 (charset 붙으면 문자열)
+    return web.Response(body=json.dumps(data).encode(), content_type="application/json")
+
+class MockGateway:
+    def __init__(self):
+        self.shard_count = 1
+        self.guilds = 0
+        self.last_guild_create = None
+        self.runner = None
+        self.port = None
+
+    def user(self):
+        return {"id": str(BOT_ID), "username": "mock", "discriminator": "0", "global_name": None, "avatar": None, "bot": True}
+
+    async def users_me(self, request):
+        return json_response(self.user())
+
+    async def application(self, request):
+        return json_response({
+            "id": str(BOT_ID),
+            "name": "mock",
+            "description": "",
+            "icon": None,
+            "bot_public": True,
+            "bot_require_code_grant": False,
+            "owner": self.user(),
+            "verify_key": "",
+            "flags": 0,
+        })
+
+    async def gateway_bot(self, request):
+        return json_response({
+            "url": f"ws://127.0.0.1:{self.port}/",
+            "shards": self.shard_count,
+            "session_start_limit": {"total": 1000, "remaining": 1000, "reset_after": 0, "max_concurrency": 1},
+        })
+
+    async def gateway(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_json({"op": 10, "d": {"heartbeat_interval": 41250}})
+
+        seq = 0
+        async for msg in ws:
+            data = msg.json()
+            if data["op"] == 1:
+                await ws.send_json({"op": 11, "d": None})
+            elif data["op"] == 2:
+                shard_id, shard_count = data["d"].get("shard", [0, 1])
+                # 길드 수는 샤드에 나눠서 (남는 건 앞쪽 샤드에)
+                count = self.guilds // shard_count + (1 if shard_id < self.guilds % shard_count else 0)
+                ids = guild_ids(shard_id, shard_count, count)
+
+                seq += 1
+                await ws.send_json({"op": 0, "t": "READY", "s": seq, "d": {
+                    "v": 10,
+                    "user": self.user(),
+                    "session_id": f"mock-{shard_id}",
+                    "resume_gateway_url": f"ws://127.0.0.1:{self.port}/",
+                    "guilds": [{"id": str(g), "unavailable": True} for g in ids],
+                    "application": {"id": str(BOT_ID), "flags": 0},
+                    "shard": [shard_id, shard_count],
+                }})
+                for g in ids:
+                    seq += 1
+                    await ws.send_json({"op": 0, "t": "GUILD_CREATE", "s": seq, "d": guild_payload(g)})
+                self.last_guild_create = time.perf_counter()
+        return ws
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/api/v10/users/@me", self.users_me)
+        app.router.add_get("/api/v10/oauth2/applications/@me", self.application)
+        app.router.add_get("/api/v10/gateway/bot", self.gateway_bot)
+        app.router.add_get("/", self.gateway)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+        # discord.py 가 실제 Discord 대신 여기로 붙도록
+        discord.http.Route.BASE = f"http://127.0.0.1:{self.port}/api/v10"
+        discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(f"ws://127.0.0.1:{self.port}/")
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+class BenchBot(commands.AutoShardedBot):
+    def __init__(self, identify_delay, **kwargs):
+        super().__init__(**kwargs)
+        self.identify_delay = identify_delay
+
+    async def before_identify_hook(self, shard_id, *, initial=False):
+        if not initial and self.identify_delay:
+            await asyncio.sleep(self.identify_delay)
+
+async def measure(server, shard_count, guilds, identify_delay):
+    server.shard_count = shard_count
+    server.guilds = guilds
+
+    # safe14 의 bot 과 같은 설정 (샤드 수는 /gateway/bot 에서 받아옴)
+    bot = BenchBot(identify_delay, command_prefix="!", intents=safe14.intents, help_command=None)
+    await bot.add_cog(safe14.Music(bot))
+    ready = asyncio.Event()
+
+    async def on_ready():
+        ready.set()
+
+    bot.add_listener(on_ready)
+
+    start = time.perf_counter()
+    task = asyncio.create_task(bot.start("mock-token"))
+    try:
+        waiter = asyncio.create_task(ready.wait())
+        await asyncio.wait({waiter, task}, timeout=600, return_when=asyncio.FIRST_COMPLETED)
+        if not ready.is_set():
+            waiter.cancel()
+            # 로그인 / 연결 실패면 그 예외를 그대로 보여줌
+            task.result() if task.done() else None
+            raise TimeoutError("on_ready 가 오지 않음")
+        elapsed = time.perf_counter() - start
+        gateway_done = server.last_guild_create - start
+        result = (shard_count, guilds, elapsed, gateway_done, len(bot.guilds), bot.shard_count)
+    finally:
+        await bot.close()
+        await asyncio.gather(task, return_exceptions=True)
+    return result
+
+async def run(args):
+    server = MockGateway()
+    await server.start()
+    print(f"{'shards':>6} {'guilds':>7} {'on_ready':>9} {'sent':>9} {'loaded':>7}")
+    try:
+        for guilds in args.guild_counts:
+            for shard_count in args.shard_counts:
+                shards, total, elapsed, gateway_done, loaded, actual = await measure(server, shard_count, guilds, args.identify_delay)
+                assert actual == shards and loaded == total, (actual, loaded)
+                print(f"{shards:>6} {total:>7} {elapsed:>8.2f}s {gateway_done:>8.2f}s {loaded:>7}")
+    finally:
+        await server.stop()
+
+def int_list(value):
+    return [int(v) for v in value.split(",")]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shard-counts", type=int_list, default=[1, 2, 4, 8])
+    parser.add_argument("--guild-counts", type=int_list, default=[1000, 5000])
+    parser.add_argument("--identify-delay", type=float, default=0.0, help="샤드 IDENTIFY 사이 대기 (실제 Discord 는 5초)")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from types import SimpleNamespace
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import wavelink
+import test2
+
+# =========================
+# 가짜 Lavalink 노드로 NodeBalancer 부하 테스트
+# 노드마다 /v4/websocket (ready + 주기적인 stats), /v4/info, /v4/sessions, /v4/stats 만 흉내 냄
+# 1) 새 플레이어를 계속 배정하면서 노드별 분포 / best_node 처리량 확인
+# 2) 노드 하나의 CPU / 프레임 손실을 올려서 과부하 판정과 이동 대상 확인
+# 3) 과부하 노드에 실제 wavelink.Player 를 붙여서 재생하다가 rebalance() → 다른 노드에서 같은 위치부터 이어지는지
+#    (move_player 가 쓰는 wavelink 내부 API 확인용, 플레이어 PATCH/DELETE 도 흉내 냄)
+# 예) python bot-run/bench/mock_lavalink.py --nodes 4 --players 2000 --stats-interval 0.2
+# =========================
+PASSWORD = "mock"
+
+class MockLavalink:
+    def __init__(self, identifier, stats_interval, cpu_per_player=0.0004):
+        self.identifier = identifier
+        self.stats_interval = stats_interval
+        self.cpu_per_player = cpu_per_player
+        self.base_load = random.uniform(0.02, 0.1)
+        self.players = 0
+        self.playing = 0
+        self.deficit = 0
+        self.nulled = 0
+        self.extra_load = 0.0
+        self.sockets = set()
+        self.player_updates = []  # (guild_id, PATCH 본문)
+        self.destroyed = []       # DELETE 받은 guild_id
+        self.runner = None
+        self.port = None
+
+    def stats(self, frames=True):
+        return {
+            "op": "stats",
+            "players": self.players,
+            "playingPlayers": self.playing,
+            "uptime": 1000,
+            "memory": {"free": 1, "used": 1, "allocated": 1, "reservable": 1},
+            "cpu": {
+                "cores": 4,
+                "systemLoad": min(1.0, self.base_load + self.extra_load + self.players * self.cpu_per_player),
+                "lavalinkLoad": 0.0,
+            },
+            # 실제 Lavalink 처럼 REST 응답에는 frameStats 가 없음
+            "frameStats": {"sent": 3000, "nulled": self.nulled, "deficit": self.deficit} if frames else None,
+        }
+
+    async def websocket(self, request):
+        if request.headers.get("Authorization") != PASSWORD:
+            raise web.HTTPUnauthorized()
+
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_json({"op": "ready", "resumed": False, "sessionId": self.identifier})
+        self.sockets.add(ws)
+        try:
+            while not ws.closed:
+                await ws.send_json(self.stats())
+                await asyncio.sleep(self.stats_interval)
+        except ConnectionError:
+            pass
+        finally:
+            self.sockets.discard(ws)
+        return ws
+
+    async def send(self, data):
+        for ws in list(self.sockets):
+            await ws.send_json(data)
+
+    async def update_player(self, request):
+        guild_id = int(request.match_info["guild_id"])
+        data = await request.json()
+        self.player_updates.append((guild_id, data))
+        return web.json_response({"guildId": str(guild_id), "track": None, "volume": 100, "paused": False})
+
+    async def destroy_player(self, request):
+        self.destroyed.append(int(request.match_info["guild_id"]))
+        return web.Response(status=204)
+
+    async def info(self, request):
+        return web.json_response({"sourceManagers": ["youtube", "soundcloud"], "plugins": []})
+
+    async def session(self, request):
+        return web.json_response({"resuming": True, "timeout": 60})
+
+    async def rest_stats(self, request):
+        data = self.stats(frames=False)
+        del data["op"]
+        return web.json_response(data)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/v4/websocket", self.websocket)
+        app.router.add_get("/v4/info", self.info)
+        app.router.add_patch("/v4/sessions/{session_id}", self.session)
+        app.router.add_get("/v4/stats", self.rest_stats)
+        app.router.add_patch("/v4/sessions/{session_id}/players/{guild_id}", self.update_player)
+        app.router.add_delete("/v4/sessions/{session_id}/players/{guild_id}", self.destroy_player)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+TRACK = {
+    "encoded": "QAAAmock",
+    "info": {
+        "identifier": "mock", "isSeekable": True, "author": "mock", "length": 180000, "isStream": False,
+        "position": 0, "title": "mock track", "uri": None, "sourceName": "soundcloud",
+    },
+    "pluginInfo": {},
+}
+
+class FakeClient:
+    # Node / Player 가 쓰는 부분만: user.id, get_channel, dispatch (MyBot.dispatch 처럼 stats 를 balancer 로 넘김)
+    def __init__(self):
+        self.user = SimpleNamespace(id=1)
+        self.channels = {}
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def dispatch(self, event_name, *args, **kwargs):
+        if event_name == "wavelink_stats_update":
+            test2.node_balancer.record_stats(*args)
+
+async def wait_for_stats(mocks, since):
+    # 모든 노드에서 since 이후의 stats 가 들어올 때까지
+    while any(
+        test2.node_balancer.stats.get(m.identifier, (0,))[0] < since for m in mocks
+    ):
+        await asyncio.sleep(0.01)
+
+def node_players(mock):
+    return wavelink.Pool.get_node(mock.identifier).players
+
+def print_nodes(mocks):
+    balancer = test2.node_balancer
+    for m in mocks:
+        node = wavelink.Pool.get_node(m.identifier)
+        print(
+            f"  {m.identifier}: players {m.players:5}  cpu {m.stats()['cpu']['systemLoad']:.2f}  "
+            f"deficit {m.deficit:4}  penalty {balancer.penalty(node):8.1f}"
+        )
+
+async def attach_player(client, node, guild_id):
+    # VoiceChannel.connect(cls=wavelink.Player(...)) 와 음성 이벤트 두 개를 직접 흘려 넣음
+    guild = SimpleNamespace(id=guild_id)
+    channel = client.channels[guild_id] = SimpleNamespace(id=guild_id, guild=guild)
+    player = wavelink.Player(nodes=[node])(client, channel)
+    node._players[guild_id] = player
+    await player.on_voice_state_update({"channel_id": str(channel.id), "session_id": "voice-session"})
+    await player.on_voice_server_update({"token": "voice-token", "endpoint": "voice.invalid"})
+    return player
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=4)
+    parser.add_argument("--players", type=int, default=2000)
+    parser.add_argument("--stats-interval", type=float, default=0.2)
+    parser.add_argument("--batch", type=int, default=50, help="stats 한 번 사이에 새로 만드는 플레이어 수")
+    args = parser.parse_args()
+
+    mocks = [MockLavalink(f"mock-{i}", args.stats_interval) for i in range(args.nodes)]
+    for m in mocks:
+        await m.start()
+
+    client = FakeClient()
+    await wavelink.Pool.connect(
+        client=client,
+        nodes=[
+            wavelink.Node(identifier=m.identifier, uri=f"http://127.0.0.1:{m.port}", password=PASSWORD)
+            for m in mocks
+        ]
+    )
+    await wait_for_stats(mocks, 0)
+    balancer = test2.node_balancer
+
+    # 1) 배정: 가짜 플레이어를 노드에 등록하고, 노드 쪽 숫자는 다음 stats 때 반영됨
+    print(f"1) 플레이어 {args.players}개 배정 (stats 사이마다 {args.batch}개)")
+    picks = 0
+    pick_time = 0.0
+    for i in range(args.players):
+        started = time.perf_counter()
+        node = balancer.best_node()
+        pick_time += time.perf_counter() - started
+        picks += 1
+
+        node._players[i] = SimpleNamespace(guild=SimpleNamespace(id=i))
+        mock = next(m for m in mocks if m.identifier == node.identifier)
+        mock.players += 1
+        mock.playing += 1
+
+        if (i + 1) % args.batch == 0:
+            await wait_for_stats(mocks, time.monotonic())
+
+    print_nodes(mocks)
+    print(f"  best_node: {picks / pick_time:,.0f} 회/s")
+
+    # 2) 과부하: 첫 노드의 CPU 와 프레임 손실을 올림
+    degraded = mocks[0]
+    degraded.extra_load = 0.5
+    degraded.deficit = 900
+    await wait_for_stats(mocks, time.monotonic())
+
+    node = wavelink.Pool.get_node(degraded.identifier)
+    penalty = balancer.penalty(node)
+    target = balancer.best_node(exclude=node)
+    print(f"2) {degraded.identifier} 과부하 (CPU +0.5, deficit 900)")
+    print_nodes(mocks)
+    print(
+        f"  과부하 판정: {penalty >= test2.NODE_DEGRADED_PENALTY}  "
+        f"이동 대상: {target.identifier}  새 플레이어 배정: {balancer.best_node().identifier}"
+    )
+
+    assert penalty >= test2.NODE_DEGRADED_PENALTY
+    assert balancer.best_node() is not node
+
+    # 3) 실제 플레이어 이동: 1) 의 가짜 플레이어는 빼고 (노드 쪽 부하 숫자는 그대로) 하나만 붙임
+    for n in wavelink.Pool.nodes.values():
+        n._players.clear()
+
+    guild_id = 10**17
+    player = await attach_player(client, node, guild_id)
+    await player.play(wavelink.Playable(TRACK))
+    await degraded.send({
+        "op": "playerUpdate",
+        "guildId": str(guild_id),
+        "state": {"time": int(time.time() * 1000), "position": 42000, "connected": True, "ping": 1},
+    })
+    while player._last_position != 42000:
+        await asyncio.sleep(0.01)
+
+    started = time.perf_counter()
+    await balancer.rebalance()
+    elapsed = time.perf_counter() - started
+
+    moved = next(m for m in mocks if m.identifier == player.node.identifier)
+    voice = [data for g, data in moved.player_updates if g == guild_id and "voice" in data]
+    replay = [data for g, data in moved.player_updates if g == guild_id and "track" in data]
+    print(f"3) rebalance: {degraded.identifier} → {moved.identifier} ({elapsed * 1000:.1f}ms)")
+    print(f"  이전 노드 DELETE: {guild_id in degraded.destroyed}  새 노드 voice: {bool(voice)}  "
+          f"다시 재생 위치: {replay[-1]['position'] if replay else None}ms")
+
+    assert player.node is not node and moved is not degraded
+    assert guild_id not in node.players and node_players(moved)[guild_id] is player
+    assert guild_id in degraded.destroyed
+    assert voice and voice[0]["voice"]["sessionId"] == "voice-session"
+    assert replay and replay[-1]["track"]["encoded"] == TRACK["encoded"]
+    assert 42000 <= replay[-1]["position"] < 42000 + 5000
+
+    for n in wavelink.Pool.nodes.values():
+        n._players.clear()
+    await wavelink.Pool.close()
+    for m in mocks:
+        await m.runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+import os
+import sys
+import asyncio
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import discord
+import safe14
+
+# =========================
+# 곡 전환 N 번 동안 view store 메모리 (soak)
+# 메시지를 보낼 때 discord.py 가 하는 것처럼, 끝나지 않은 view 만 view store 에 넣음
+# old: 곡마다 새 View(timeout=None) → 계속 쌓임
+# new: PlayerControls (만들자마자 stop, 버튼은 add_dynamic_items 로 한 번만 등록)
+# 예) python bot-run/bench/soak_player_controls.py --transitions 100000
+# =========================
+
+class OldPlayerControls(discord.ui.View):
+    # 예전 구현과 같은 형태 (곡마다 하나, timeout 없음)
+    def __init__(self, vc):
+        super().__init__(timeout=None)
+        self.vc = vc
+
+    @discord.ui.button(label="⏯", style=discord.ButtonStyle.primary)
+    async def pause_resume(self, interaction, button):
+        pass
+
+    @discord.ui.button(label="⏭", style=discord.ButtonStyle.secondary)
+    async def skip(self, interaction, button):
+        pass
+
+def send(state, view, message_id):
+    # Messageable.send 에서 view 를 저장하는 조건 그대로
+    if view and not view.is_finished() and view.is_dispatchable():
+        state.store_view(view, message_id)
+
+async def soak(make_view, transitions, samples):
+    state = safe14.bot._connection
+    state._view_store = type(state._view_store)(state)
+    safe14.bot.add_dynamic_items(safe14.PlayerButton)
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    points = []
+    step = max(1, transitions // samples)
+    for i in range(1, transitions + 1):
+        guild_id = 10**17 + i % 1000
+        send(state, make_view(guild_id), message_id=i)
+        if i % step == 0:
+            points.append((i, tracemalloc.get_traced_memory()[0] - base))
+    tracemalloc.stop()
+    return points
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transitions", type=int, default=100000)
+    parser.add_argument("--old-transitions", type=int, default=10000, help="예전 방식은 메모리를 많이 써서 따로 지정")
+    parser.add_argument("--samples", type=int, default=5)
+    args = parser.parse_args()
+
+    for name, make_view, transitions in (
+        ("old", OldPlayerControls, args.old_transitions),
+        ("new", safe14.PlayerControls, args.transitions),
+    ):
+        points = asyncio.run(soak(make_view, transitions, args.samples))
+        print(f"{name}: " + "  ".join(f"{i:>7}회 {size / 1024 / 1024:7.2f}MB" for i, size in points))
+
+    # 새 방식은 곡 수와 상관없이 그대로여야 함
+    points = asyncio.run(soak(safe14.PlayerControls, args.transitions, args.samples))
+    growth = points[-1][1] - points[0][1]
+    print(f"new 증가량 (처음 → 끝): {growth / 1024:.1f}KB")
+    assert growth < 1024 * 1024, "view store 메모리가 곡 전환 수에 따라 늘어남"
+
+if __name__ == "__main__":
+    main()
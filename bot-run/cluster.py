@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import aiohttp
+from dotenv import load_dotenv
+
+# =========================
+# 클러스터 런처
+# 샤드를 N개 프로세스로 나눠 띄우고, 죽으면 다시 띄움
+# 예) python bot-run/cluster.py --clusters 4 --shard-count 16
+# =========================
+load_dotenv()
+TOKEN = os.getenv("DISCORD_TOKEN")
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "safe14.py")
+IPC_HOST = "127.0.0.1"
+RESTART_DELAY_MIN = 1      # 재시작 대기(초), 연속으로 죽으면 두 배씩 증가
+RESTART_DELAY_MAX = 60
+STABLE_UPTIME = 60         # 이 시간 이상 살아 있었으면 대기 시간 초기화
+PRESENCE_INTERVAL = 60     # 전체 서버 수 전달 주기(초)
+
+async def fetch_recommended_shards():
+    async with aiohttp.ClientSession() as session:
+        async with session.get(
+            "https://discord.com/api/v10/gateway/bot",
+            headers={"Authorization": f"Bot {TOKEN}"}
+        ) as resp:
+            resp.raise_for_status()
+            return (await resp.json())["shards"]
+
+def split_shards(shard_count, clusters):
+    # 연속된 샤드 범위로 최대한 고르게 나눔
+    base, extra = divmod(shard_count, clusters)
+    ranges = []
+    start = 0
+    for i in range(clusters):
+        size = base + (1 if i < extra else 0)
+        if size:
+            ranges.append((start, start + size - 1))
+        start += size
+    return ranges
+
+# =========================
+# IPC 허브 (JSON lines over TCP)
+# =========================
+class ClusterHub:
+    def __init__(self):
+        self.writers = {}       # cluster_id -> StreamWriter
+        self.guild_counts = {}  # cluster_id -> 서버 수
+        self.sent_total = None
+
+    def total(self):
+        return sum(self.guild_counts.values())
+
+    async def send(self, writer, msg):
+        try:
+            writer.write((json.dumps(msg) + "\n").encode())
+            await writer.drain()
+        except (ConnectionError, RuntimeError):
+            pass
+
+    async def broadcast(self, msg, exclude=None):
+        for cluster_id, writer in list(self.writers.items()):
+            if cluster_id != exclude:
+                await self.send(writer, msg)
+
+    async def handle(self, reader, writer):
+        cluster_id = None
+        try:
+            async for line in reader:
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    continue
+
+                op = msg.get("op")
+                if op == "hello":
+                    cluster_id = msg["cluster"]
+                    self.writers[cluster_id] = writer
+                    if self.sent_total is not None:
+                        await self.send(writer, {"op": "guild_total", "count": self.sent_total})
+
+                elif op == "guild_count" and cluster_id is not None:
+                    self.guild_counts[cluster_id] = msg["count"]
+
+                elif op == "music_channels":
+                    # 전용채널 추가/삭제를 다른 클러스터에 바로 반영
+                    await self.broadcast(msg, exclude=cluster_id)
+        except ConnectionError:
+            pass
+        finally:
+            if cluster_id is not None and self.writers.get(cluster_id) is writer:
+                del self.writers[cluster_id]
+            writer.close()
+
+    async def presence_loop(self):
+        # presence 변경은 레이트리밋이 빡빡하므로 주기적으로 바뀐 경우에만 전달
+        while True:
+            await asyncio.sleep(PRESENCE_INTERVAL)
+            total = self.total()
+            if total != self.sent_total:
+                self.sent_total = total
+                await self.broadcast({"op": "guild_total", "count": total})
+
+# =========================
+# 워커 감시 / 재시작
+# =========================
+async def supervise(cluster_id, shard_range, shard_count, ipc_port):
+    start, end = shard_range
+    env = dict(
+        os.environ,
+        CLUSTER_ID=str(cluster_id),
+        CLUSTER_IPC=f"{IPC_HOST}:{ipc_port}"
+    )
+    delay = RESTART_DELAY_MIN
+
+    while True:
+        started = time.monotonic()
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, BOT_SCRIPT,
+            "--shard-count", str(shard_count),
+            "--shards", f"{start}-{end}",
+            env=env
+        )
+        print(f"[cluster {cluster_id}] 샤드 {start}-{end} 시작 (pid {proc.pid})")
+
+        try:
+            code = await proc.wait()
+        except asyncio.CancelledError:
+            if proc.returncode is None:
+                proc.terminate()
+                await proc.wait()
+            raise
+
+        if time.monotonic() - started >= STABLE_UPTIME:
+            delay = RESTART_DELAY_MIN
+
+        print(f"[cluster {cluster_id}] 종료 코드 {code}, {delay}초 후 재시작")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, RESTART_DELAY_MAX)
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clusters", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shard-count", type=int, default=None)
+    args = parser.parse_args()
+
+    shard_count = args.shard_count or await fetch_recommended_shards()
+    ranges = split_shards(shard_count, min(args.clusters, shard_count))
+
+    hub = ClusterHub()
+    server = await asyncio.start_server(hub.handle, IPC_HOST, 0)
+    ipc_port = server.sockets[0].getsockname()[1]
+
+    print(f"샤드 {shard_count}개를 {len(ranges)}개 프로세스로 실행 (IPC 포트 {ipc_port})")
+
+    async with server:
+        await asyncio.gather(
+            hub.presence_loop(),
+            *(
+                supervise(cluster_id, shard_range, shard_count, ipc_port)
+                for cluster_id, shard_range in enumerate(ranges)
+            )
+        )
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -1,10 +1,29 @@
 import os
+import argparse
 from dotenv import load_dotenv
 import discord
 from discord.ext import commands, tasks
 import asyncio
 from yt_dlp import YoutubeDL
 import json
+import re
+import sys
+import sqlite3
+import tempfile
+import time
+import threading
+import traceback
+from bisect import bisect_left
+import aiohttp
+from aiohttp import web
+from datetime import datetime, timedelta, timezone
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict, deque
+from functools import lru_cache
+from itertools import islice
+from urllib.parse import urlparse, parse_qs
 
 # =========================
 # 
@@ -16,21 +35,144 @@ import json
 
 CHANNEL_FILE = "music_channels.json"
 
-def load_music_channels():
+def load_music_channels(path=CHANNEL_FILE):
+    # 파일이 깨져 있으면 None (호출한 쪽에서 이전 목록을 유지)
     try:
-        with open(CHANNEL_FILE, "r", encoding="utf-8") as f:
+        with open(path, "r", encoding="utf-8") as f:
             return set(json.load(f).get("music_channels", []))
     except FileNotFoundError:
         return set()
+    except (json.JSONDecodeError, UnicodeDecodeError, AttributeError, TypeError) as e:
+        print(f"[music_channels] {path} 읽기 실패: {e}")
+        return None
+
+CHANNEL_SAVE_DELAY = 1.0  # 연속 추가/삭제를 한 번의 쓰기로 묶는 대기 시간(초)
+
+def save_music_channels(channels, path=CHANNEL_FILE):
+    # 임시 파일에 쓰고 fsync 후 rename → 중간에 죽어도 파일이 잘리지 않음
+    # 임시 파일 이름은 매번 새로 (여러 워커가 동시에 저장해도 서로 덮어쓰지 않게)
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f"{os.path.basename(path)}.",
+        suffix=".tmp",
+        dir=os.path.dirname(os.path.abspath(path))
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(
+                {"music_channels": list(channels)},
+                f,
+                ensure_ascii=False,
+                indent=2
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
 
-def save_music_channels(channels):
-    with open(CHANNEL_FILE, "w", encoding="utf-8") as f:
-        json.dump(
-            {"music_channels": list(channels)},
-            f,
-            ensure_ascii=False,
-            indent=2
-        )
+class MusicChannelRegistry:
+    """전용채널 목록을 메모리에 들고 있다가 파일이 바뀌었을 때만 다시 읽는다."""
+
+    def __init__(self, path):
+        self.path = path
+        self.channels = set()
+        self.mtime = None
+        self.dirty = False
+        self.save_handle = None
+        self.save_lock = asyncio.Lock()
+        self.reload()
+
+    def __contains__(self, channel_id):
+        return channel_id in self.channels
+
+    def _stat_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def reload(self):
+        # 아직 디스크에 안 쓴 변경이 있으면 파일 내용으로 덮어쓰지 않음
+        if self.dirty or self.save_lock.locked():
+            return False
+
+        mtime = self._stat_mtime()
+        if mtime == self.mtime:
+            return False
+
+        channels = load_music_channels(self.path)
+        # 깨진 파일은 다시 바뀔 때까지 건너뜀 (지금 목록 유지)
+        self.mtime = mtime
+        if channels is None:
+            return False
+
+        self.channels = channels
+        return True
+
+    def add(self, channel_id):
+        if channel_id in self.channels:
+            return False
+
+        self.channels.add(channel_id)
+        self.schedule_save()
+        return True
+
+    def remove(self, channel_id):
+        if channel_id not in self.channels:
+            return False
+
+        self.channels.remove(channel_id)
+        self.schedule_save()
+        return True
+
+    def apply_remote(self, action, channel_id):
+        # 다른 클러스터에서 바뀐 내용 (파일은 그쪽에서 저장)
+        if action == "add":
+            self.channels.add(channel_id)
+        elif action == "remove":
+            self.channels.discard(channel_id)
+
+    # =========================
+    # 비동기 저장 (debounce)
+    # =========================
+    def schedule_save(self):
+        self.dirty = True
+        if self.save_handle is None:
+            loop = asyncio.get_running_loop()
+            self.save_handle = loop.call_later(
+                CHANNEL_SAVE_DELAY,
+                lambda: asyncio.create_task(self.flush())
+            )
+
+    def _write(self, channels):
+        save_music_channels(channels, self.path)
+        return self._stat_mtime()
+
+    async def flush(self):
+        if self.save_handle:
+            self.save_handle.cancel()
+            self.save_handle = None
+
+        async with self.save_lock:
+            if not self.dirty:
+                return
+
+            self.dirty = False
+            snapshot = list(self.channels)
+            loop = asyncio.get_running_loop()
+            try:
+                self.mtime = await loop.run_in_executor(
+                    None, self._write, snapshot
+                )
+            except OSError as e:
+                self.dirty = True
+                print(f"전용채널 저장 실패: {e}")
+
+music_channels = MusicChannelRegistry(CHANNEL_FILE)
 
 # =========================
 # Settings
@@ -45,11 +187,102 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.voice_states = True
 
+# =========================
+# 메트릭 (핫패스에서는 숫자만 올리고, 합산은 /metrics 요청 때)
+# =========================
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+RESOLVE_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+GAP_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUEUE_DEPTH_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels=""):
+        sep = "," if labels else ""
+        suffix = f"{{{labels}}}" if labels else ""
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {total}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+# REST 경로의 ID/토큰을 지워 라우트 단위로 묶음
+# 예) /api/v10/channels/123.../messages/456... → /channels/:id/messages/:id
+_ROUTE_VERSION = re.compile(r"^/api/v\d+")
+_ROUTE_ID = re.compile(r"/\d{15,21}(?=/|$)")
+_ROUTE_TOKEN = re.compile(r"(/(?:webhooks|interactions)/:id)/[^/]+")
+_ROUTE_REACTION = re.compile(r"(/reactions)/[^/]+")
+
+# 같은 경로가 계속 들어오므로 정리 결과를 캐시 (크기 제한)
+@lru_cache(maxsize=4096)
+def rest_route(path):
+    path = _ROUTE_VERSION.sub("", path)
+    path = _ROUTE_ID.sub("/:id", path)
+    path = _ROUTE_TOKEN.sub(r"\1/:token", path)
+    return _ROUTE_REACTION.sub(r"\1/:emoji", path)
+
+class RestStats:
+    def __init__(self):
+        self.calls = {}         # (method, route) -> 횟수
+        self.rate_limited = {}  # (method, route) -> 429 횟수
+        self.trace = aiohttp.TraceConfig()
+        self.trace.on_request_end.append(self._on_request_end)
+
+    async def _on_request_end(self, session, ctx, params):
+        path = params.url.path
+        if not path.startswith("/api/"):  # 게이트웨이/음성 웹소켓 제외
+            return
+
+        # id 가 들어간 원래 경로로 세면 키가 끝없이 늘어나므로 라우트로 정리해서 셈
+        key = (params.method, rest_route(path))
+        self.calls[key] = self.calls.get(key, 0) + 1
+        if params.response.status == 429:
+            self.rate_limited[key] = self.rate_limited.get(key, 0) + 1
+
+rest_stats = RestStats()
+
+# =========================
+# Sharding (예: --shard-count 8 --shards 0-3)
+# =========================
+def parse_shard_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shard-count", type=int, default=None)
+    parser.add_argument("--shards", default=None, help="이 프로세스가 맡을 샤드 범위 (예: 0-3)")
+    args, _ = parser.parse_known_args()
+
+    shard_ids = None
+    if args.shards:
+        if not args.shard_count:
+            parser.error("--shards 를 쓰려면 --shard-count 도 지정해야 합니다.")
+        start, _, end = args.shards.partition("-")
+        shard_ids = list(range(int(start), int(end or start) + 1))
+
+    return args.shard_count, shard_ids
+
+SHARD_COUNT, SHARD_IDS = parse_shard_args()
+
 # ✅ 기본 help 제거
-bot = commands.Bot(
+bot = commands.AutoShardedBot(
     command_prefix="!",
     intents=intents,
-    help_command=None
+    help_command=None,
+    shard_count=SHARD_COUNT,
+    shard_ids=SHARD_IDS,
+    http_trace=rest_stats.trace
     )
 
 # =========================
@@ -57,13 +290,76 @@ bot = commands.Bot(
 # =========================
 @tasks.loop(hours=24)
 async def update_server_count():
-    server_count = len(bot.guilds)
+    # 클러스터로 실행 중이면 전체 합계, 아니면 이 프로세스의 모든 샤드 합계
+    server_count = cluster.guild_total or len(bot.guilds)
     await bot.change_presence(
         activity=discord.Game(
             name=f"🎶 서버 {server_count}개에서 음악 재생중"
         )
     )
 
+# =========================
+# 클러스터 IPC (cluster.py 로 실행했을 때만)
+# =========================
+CLUSTER_IPC = os.getenv("CLUSTER_IPC")  # "127.0.0.1:port"
+CLUSTER_ID = int(os.getenv("CLUSTER_ID", "0"))
+
+class ClusterClient:
+    def __init__(self):
+        self.writer = None
+        self.task = None
+        self.guild_total = None
+
+    def start(self):
+        if CLUSTER_IPC and self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        host, _, port = CLUSTER_IPC.rpartition(":")
+        while True:
+            try:
+                reader, self.writer = await asyncio.open_connection(host, int(port))
+                await self.send({"op": "hello", "cluster": CLUSTER_ID})
+                await self.send_guild_count()
+
+                async for line in reader:
+                    self.handle(json.loads(line))
+            except (OSError, ValueError):
+                pass
+
+            self.writer = None
+            await asyncio.sleep(5)
+
+    async def send(self, msg):
+        if self.writer is None:
+            return
+        try:
+            self.writer.write((json.dumps(msg) + "\n").encode())
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+
+    async def send_guild_count(self):
+        await self.send({"op": "guild_count", "count": len(bot.guilds)})
+
+    def handle(self, msg):
+        op = msg.get("op")
+        if op == "guild_total":
+            self.guild_total = msg["count"]
+            if bot.is_ready():
+                asyncio.create_task(update_server_count())
+        elif op == "music_channels":
+            music_channels.apply_remote(msg["action"], msg["channel_id"])
+
+cluster = ClusterClient()
+
+# =========================
+# 전용채널 파일 감시 (외부 수정 반영)
+# =========================
+@tasks.loop(seconds=5)
+async def watch_music_channels():
+    music_channels.reload()
+
 # =========================
 # yt-dlp / ffmpeg
 # =========================
@@ -75,56 +371,1309 @@ ytdl_opts = {
     "noplaylist": True,
 }
 
+PREFETCH_DEPTH = 2  # 미리 추출해 둘 대기열 앞쪽 곡 수
+
 ffmpeg_opts = {
     "before_options": "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5",
     "options": "-vn",
 }
 
-ytdl = YoutubeDL(ytdl_opts)
+# pcm : 기존 방식 (FFmpegPCMAudio + PCMVolumeTransformer), 기본값
+# opus: ffmpeg 이 볼륨 적용 + Opus 인코딩까지 처리 (파이썬 쪽 부하는 줄지만 ffmpeg 포함 총 CPU 는 pcm 보다 큼)
+#       원본이 Opus 이고 PLAYBACK_VOLUME=1.0 일 때만 재인코딩 없이 그대로 복사
+AUDIO_MODE = os.getenv("AUDIO_MODE", "pcm")
+PLAYBACK_VOLUME = float(os.getenv("PLAYBACK_VOLUME", "0.08"))
 
-class YTDLSource(discord.PCMVolumeTransformer):
-    def __init__(self, source, *, data, volume=0.08):
-        super().__init__(source, volume)
+# =========================
+# yt-dlp 전용 추출 스레드풀
+# =========================
+YTDL_MODE = os.getenv("YTDL_MODE", "thread")  # thread | process
+YTDL_WORKERS = int(os.getenv("YTDL_WORKERS", "4"))
+YTDL_QUEUE_LIMIT = int(os.getenv("YTDL_QUEUE_LIMIT", "32"))  # 스레드풀에 넘길 수 있는 최대 요청 수
+PLAYLIST_WORKERS = 2    # 플레이리스트 목록을 넘기는 스레드 수
+PLAYLIST_CHUNK = 25     # 대기열에 한 번에 넣을 곡 수 (첫 곡은 바로)
+
+_ytdl_local = threading.local()
+
+def worker_ytdl():
+    # YoutubeDL 은 동시 사용에 안전하지 않으므로 스레드마다 하나씩
+    ytdl = getattr(_ytdl_local, "ytdl", None)
+    if ytdl is None:
+        ytdl = _ytdl_local.ytdl = YoutubeDL(ytdl_opts)
+    return ytdl
+
+# 코그에서 실제로 쓰는 값만 돌려줌 (프로세스 간 전달 / 캐시 크기 최소화)
+COMPACT_FIELDS = (
+    "id", "extractor_key", "url", "acodec", "title",
+    "duration", "webpage_url", "thumbnail",
+)
+
+class ExtractError(Exception):
+    pass
+
+def extract_compact(query):
+    try:
+        data = worker_ytdl().extract_info(query, download=False)
+    except Exception as e:
+        # yt-dlp 예외는 pickle 이 안 돼서 process 모드에서는 원인이 사라짐 → 메시지만 담아서 다시 던짐
+        raise ExtractError(str(e)) from None
+
+    if "entries" in data:
+        if not data["entries"]:
+            raise ExtractError(f"검색 결과가 없습니다: {query}")
+        data = data["entries"][0]
+
+    return {key: data.get(key) for key in COMPACT_FIELDS}
+
+# =========================
+# 플레이리스트 (flat 추출 → 곡 URL 만 받아서 조금씩 대기열에 넣음)
+# =========================
+flat_ytdl_opts = {
+    "quiet": True,
+    "default_search": "ytsearch1",
+    "extract_flat": "in_playlist",
+    "source_address": "0.0.0.0",
+    "noplaylist": False,
+}
+
+PLAYLIST_SKIP_TITLES = ("[Private video]", "[Deleted video]")
+PLAYLIST_MAX_REDIRECTS = 3  # url 결과를 따라가는 최대 횟수
+
+def compact_metadata(data):
+    thumbnail = data.get("thumbnail")
+    if not thumbnail and data.get("thumbnails"):
+        thumbnail = data["thumbnails"][-1].get("url")
+    return {"title": data.get("title"), "duration": data.get("duration"), "thumbnail": thumbnail}
+
+def youtube_playlist_id(query):
+    try:
+        parsed = urlparse(query.strip())
+    except ValueError:
+        return None
+
+    host = (parsed.hostname or "").lower()
+    if not host.endswith("youtube.com"):
+        return None
+
+    params = parse_qs(parsed.query)
+    # watch?v=...&list=... 는 기존처럼 한 곡으로 처리
+    if parsed.path != "/playlist" and "v" in params:
+        return None
+
+    return params.get("list", [None])[0]
+
+def worker_flat_ytdl():
+    ytdl = getattr(_ytdl_local, "flat_ytdl", None)
+    if ytdl is None:
+        ytdl = _ytdl_local.flat_ytdl = YoutubeDL(flat_ytdl_opts)
+    return ytdl
+
+def stream_playlist_entries(query, emit, stop):
+    # process=False → entries 가 제너레이터라 페이지를 넘기는 대로 바로 받을 수 있음
+    ytdl = worker_flat_ytdl()
+    info = ytdl.extract_info(query, download=False, process=False)
+
+    # watch?v=..&list=.. / 믹스 등은 목록이 아니라 url 결과로 한 번 더 넘겨줌 (process=False 라 직접 따라감)
+    for _ in range(PLAYLIST_MAX_REDIRECTS):
+        if info.get("_type") not in ("url", "url_transparent") or not info.get("url"):
+            break
+        info = ytdl.extract_info(info["url"], download=False, process=False, ie_key=info.get("ie_key"))
+
+    if "entries" not in info:
+        emit([dict(compact_metadata(info), url=info.get("webpage_url") or query)])
+        return
+
+    chunk = []
+    size = 1  # 첫 곡은 바로 넘겨서 재생부터 시작
+    for entry in info["entries"]:
+        if stop.is_set():
+            return
+
+        url = entry and (entry.get("url") or entry.get("webpage_url"))
+        if not url or entry.get("title") in PLAYLIST_SKIP_TITLES:
+            continue
+
+        # flat 항목에도 제목/길이가 있으므로 대기열 표시에 그대로 사용
+        chunk.append(dict(compact_metadata(entry), url=url))
+        if len(chunk) >= size:
+            emit(chunk)
+            chunk = []
+            size = PLAYLIST_CHUNK
+
+    if chunk and not stop.is_set():
+        emit(chunk)
+
+class YTDLExtractor:
+    def __init__(self, mode=YTDL_MODE, workers=YTDL_WORKERS, queue_limit=YTDL_QUEUE_LIMIT):
+        self.mode = mode
+        self.workers = workers
+        self.executor = None
+        self.playlist_executor = None
+        self.slots = asyncio.Semaphore(max(queue_limit, workers))
+        self.waiting = 0     # 슬롯이 없어 대기 중인 요청
+        self.submitted = 0   # 스레드풀에 들어가 있는 요청
+        self.completed = 0
+        self.failed = 0
+        self.latency = Histogram(RESOLVE_BUCKETS)
+
+    def start(self):
+        if self.executor is not None:
+            return
+
+        if self.mode == "process":
+            # 워커 프로세스마다 YoutubeDL 을 미리 만들어 둠 → 추출 중 GIL 을 봇과 나눠 쓰지 않음
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=worker_ytdl
+            )
+        else:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="ytdl",
+                initializer=worker_ytdl
+            )
+
+        # 목록을 끝까지 넘기는 동안 일반 검색 워커를 잡고 있지 않도록 따로 둠
+        # (process 모드에서도 스레드 → 곡 목록을 loop 로 바로 넘길 수 있음)
+        if self.playlist_executor is None:
+            self.playlist_executor = ThreadPoolExecutor(
+                max_workers=PLAYLIST_WORKERS,
+                thread_name_prefix="ytdl-playlist"
+            )
+
+    def _discard(self, executor):
+        # 워커 프로세스가 죽으면(OOM 등) 풀 전체가 못 쓰게 되므로 버리고 다음 요청에서 새로 만듦
+        if self.executor is executor:
+            print("yt-dlp 워커 프로세스가 죽어서 프로세스 풀을 다시 만듭니다.")
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def _submit(self, query):
+        self.start()
+        executor = self.executor
+        try:
+            return executor, executor.submit(extract_compact, query)
+        except BrokenProcessPool:
+            # 아직 실행 안 된 요청이므로 새 풀에 한 번 더 넘김
+            self._discard(executor)
+            self.start()
+            return self.executor, self.executor.submit(extract_compact, query)
+
+    def _release(self):
+        self.submitted -= 1
+        self.slots.release()
+
+    async def extract(self, query):
+        loop = asyncio.get_running_loop()
+        queued_at = time.perf_counter()
+
+        # 슬롯이 다 찼으면 여기서 기다림 (backpressure)
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.submitted += 1
+        try:
+            executor, future = self._submit(query)
+        except Exception:
+            # 넘기지도 못했으면 완료 콜백이 없으므로 여기서 바로 슬롯을 돌려줌
+            self._release()
+            self.failed += 1
+            raise
+
+        # 취소돼도 실제 작업이 끝날 때 슬롯을 돌려줌
+        def on_done(_):
+            try:
+                loop.call_soon_threadsafe(self._release)
+            except RuntimeError:
+                pass
+
+        future.add_done_callback(on_done)
+
+        try:
+            data = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            raise
+        except BrokenProcessPool:
+            self._discard(executor)
+            self.failed += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+
+        self.completed += 1
+        self.latency.observe(time.perf_counter() - queued_at)
+        return data
+
+    async def stream_playlist(self, query, on_chunk, stop):
+        # on_chunk 는 loop 스레드에서 곡 정보(url/title/duration/thumbnail) 리스트를 받아서 호출됨
+        loop = asyncio.get_running_loop()
+        self.start()
+
+        def emit(chunk):
+            try:
+                loop.call_soon_threadsafe(on_chunk, chunk)
+            except RuntimeError:
+                stop.set()
+
+        try:
+            await loop.run_in_executor(
+                self.playlist_executor, stream_playlist_entries, query, emit, stop
+            )
+        finally:
+            # 취소돼도 스레드 쪽이 다음 곡에서 멈추도록
+            stop.set()
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        if self.playlist_executor is not None:
+            self.playlist_executor.shutdown(wait=False, cancel_futures=True)
+            self.playlist_executor = None
+
+extractor = YTDLExtractor()
+
+# =========================
+# Single-flight (같은 요청 합치기)
+# =========================
+class SingleFlight:
+    def __init__(self):
+        self.inflight = {}
+        self.calls = 0      # 실제로 실행된 횟수
+        self.collapsed = 0  # 진행 중인 요청에 합쳐진 횟수
+
+    def _done(self, key, task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+
+        # 기다리던 쪽이 모두 취소됐어도 예외 경고가 남지 않도록
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, func):
+        task = self.inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = self.inflight[key] = asyncio.create_task(func())
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.collapsed += 1
+
+        # 한 요청자가 취소돼도 다른 요청자를 위해 작업은 계속
+        return await asyncio.shield(task)
+
+# =========================
+# 검색 결과 캐시 (TTL + LRU)
+# =========================
+TRACK_CACHE_SIZE = 512
+TRACK_CACHE_TTL = 60 * 60      # 최대 보관 시간(초)
+STREAM_EXPIRE_MARGIN = 10 * 60  # 스트림 URL 만료 전 여유 시간(초)
+
+YOUTUBE_ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
+
+def youtube_video_id(query):
+    try:
+        parsed = urlparse(query.strip())
+    except ValueError:
+        return None
+
+    host = (parsed.hostname or "").lower()
+    if host.endswith("youtu.be"):
+        video_id = parsed.path.lstrip("/")
+    elif host.endswith("youtube.com"):
+        if parsed.path.startswith(("/shorts/", "/live/")):
+            video_id = parsed.path.split("/")[2]
+        else:
+            video_id = parse_qs(parsed.query).get("v", [""])[0]
+    else:
+        return None
+
+    return video_id if YOUTUBE_ID_RE.match(video_id) else None
+
+def track_cache_key(query):
+    video_id = youtube_video_id(query)
+    if video_id:
+        return f"yt:{video_id}"
+
+    query = query.strip()
+    parsed = urlparse(query)
+    if parsed.scheme and parsed.netloc:
+        # URL 은 대소문자가 의미 있으므로 그대로 사용
+        return "url:" + query
+    return "q:" + " ".join(query.lower().split())
+
+def stream_expire_at(stream_url):
+    # 서명된 googlevideo URL 의 expire 파라미터(unix time)
+    try:
+        return int(parse_qs(urlparse(stream_url).query)["expire"][0])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+class TrackCache:
+    def __init__(self, max_size=TRACK_CACHE_SIZE, ttl=TRACK_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, data = entry
+        if expires_at <= time.time():
+            del self.entries[key]
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        now = time.time()
+        expires_at = now + self.ttl
+
+        url_expire = stream_expire_at(data.get("url", ""))
+        if url_expire:
+            expires_at = min(expires_at, url_expire - STREAM_EXPIRE_MARGIN)
+
+        if expires_at <= now:
+            return
+
+        self.entries[key] = (expires_at, data)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+track_cache = TrackCache()
+resolve_flight = SingleFlight()
+
+def stream_expires_soon(data, margin=STREAM_EXPIRE_MARGIN):
+    expire = stream_expire_at(data.get("url", ""))
+    return expire is not None and expire - time.time() < margin
+
+STREAM_RETRY_LIMIT = 2  # 403 으로 끊겼을 때 같은 곡을 다시 추출해서 이어 붙이는 최대 횟수
+
+FFMPEG_STDERR_WAIT = 2  # 곡이 끝난 뒤 ffmpeg 의 마지막 에러 출력을 기다리는 최대 시간(초)
+
+class FFmpegErrorLog:
+    # ffmpeg stderr 를 직접 만든 파이프로 받아서 한 줄씩 읽음
+    # (discord.py 의 파이프 읽기는 8KB 단위라 에러가 ffmpeg 종료 뒤에야 들어옴)
+    # → 원래처럼 콘솔에 바로 출력하면서 만료된 URL(HTTP 403) 로 끊긴 건지 기록
+    def __init__(self):
+        self.forbidden = False
+        read_fd, self.write_fd = os.pipe()
+        self.reader = threading.Thread(target=self._read, args=(read_fd,), daemon=True, name="ffmpeg-stderr")
+        self.reader.start()
+
+    def fileno(self):
+        return self.write_fd
+
+    def attached(self):
+        # ffmpeg 이 쓰기 쪽을 넘겨받은 뒤 우리 쪽은 닫아야 ffmpeg 종료 시 EOF 가 옴
+        if self.write_fd is not None:
+            os.close(self.write_fd)
+            self.write_fd = None
+
+    def _read(self, read_fd):
+        with open(read_fd, "rb") as f:
+            for line in f:
+                if b"HTTP error 403" in line:
+                    self.forbidden = True
+                sys.stderr.write(line.decode("utf-8", "replace"))
+
+    def wait(self, timeout=FFMPEG_STDERR_WAIT):
+        # ffmpeg 이 끝나고 stderr 를 끝까지 읽을 때까지 (forbidden 을 보기 전에)
+        self.reader.join(timeout)
+
+def ffmpeg_source_opts(start=0):
+    before_options = ffmpeg_opts["before_options"]
+    if start:
+        before_options += f" -ss {start:.2f}"
+    return {"before_options": before_options, "options": ffmpeg_opts["options"]}
+
+class TrackMetadata:
+    def _load_metadata(self, data, start=0):
         self.data = data
         self.title = data.get("title")
         self.duration = data.get("duration")
         self.url = data.get("webpage_url")
         self.thumbnail = data.get("thumbnail")
+        self.start = start
+        self.stopped = False  # 사용자가 건너뛰기/정지로 멈춤
+        self.frames = 0
+
+    def read(self):
+        frame = super().read()
+        if frame:
+            self.frames += 1
+        return frame
+
+    @property
+    def position(self):
+        # 한 프레임 = 20ms, 일시정지 중에는 read 가 불리지 않음
+        return self.start + self.frames * 0.02
+
+class YTDLSource(TrackMetadata, discord.PCMVolumeTransformer):
+    def __init__(self, source, *, data, volume=PLAYBACK_VOLUME, start=0):
+        super().__init__(source, volume)
+        self._load_metadata(data, start)
+
+    @classmethod
+    async def resolve(cls, query, *, loop, fresh=False):
+        key = track_cache_key(query)
+        data = None if fresh else track_cache.get(key)
+
+        if data is None:
+            data = await resolve_flight.do(
+                key,
+                lambda: cls._extract(key, query)
+            )
+
+        return data
+
+    @classmethod
+    async def _extract(cls, key, query):
+        data = await extractor.extract(query)
+        track_cache.put(key, data)
+        if data.get("id") and data.get("extractor_key") == "Youtube":
+            track_cache.put(f"yt:{data['id']}", data)
+        return data
+
+    @classmethod
+    def from_data(cls, data, *, start=0):
+        if AUDIO_MODE == "opus":
+            return YTDLOpusSource(data, start=start)
+
+        errors = FFmpegErrorLog()
+        try:
+            source = discord.FFmpegPCMAudio(data["url"], stderr=errors, **ffmpeg_source_opts(start))
+        finally:
+            errors.attached()
+        source = cls(source, data=data, start=start)
+        source.errors = errors
+        return source
 
     @classmethod
     async def from_query(cls, query, *, loop):
+        data = await cls.resolve(query, loop=loop)
+        return cls.from_data(data)
+
+class YTDLOpusSource(TrackMetadata, discord.FFmpegOpusAudio):
+    def __init__(self, data, *, volume=PLAYBACK_VOLUME, start=0):
+        opts = ffmpeg_source_opts(start)
+        options = opts["options"]
+
+        # 볼륨 필터가 필요 없고 원본이 Opus(webm) 면 재인코딩 없이 그대로 복사
+        passthrough = volume == 1.0 and data.get("acodec") == "opus"
+        if not passthrough:
+            options += f" -af volume={volume}"
+
+        self.errors = FFmpegErrorLog()
+        try:
+            super().__init__(
+                data["url"],
+                codec="copy" if passthrough else None,
+                before_options=opts["before_options"],
+                options=options,
+                stderr=self.errors
+            )
+        finally:
+            self.errors.attached()
+        self._load_metadata(data, start)
+
+# =========================
+# Guild Queue
+# =========================
+QUEUE_MAX_SIZE = 500  # 서버당 최대 대기곡 수
+QUEUE_USER_LIMIT = 50  # 한 사람이 넣을 수 있는 최대 대기곡 수 (0 이면 제한 없음)
+PLAYLIST_USER_LIMIT = QUEUE_MAX_SIZE  # 플레이리스트로 넣을 때는 서버 한도까지 (500곡짜리도 한 번에)
+
+class QueueFull(Exception):
+    pass
+
+class QueueEntry:
+    # Member/Channel 객체 대신 ID 만 저장 → 재생 시점에 캐시에서 다시 찾음
+    __slots__ = (
+        "guild_id", "channel_id", "requester_id", "query", "prefetch", "entry_id", "start",
+        "title", "duration", "thumbnail", "queue",
+    )
+
+    def __init__(self, guild_id, channel_id, requester_id, query):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.requester_id = requester_id
+        self.query = query
+        self.prefetch = None  # 미리 추출 중인 Task
+        self.entry_id = None  # 저장용 순번
+        self.start = 0        # 이어서 재생할 위치(초)
+        # 대기열 표시용 (화면에 보일 때만 채움, None 이면 아직 모름)
+        self.title = None
+        self.duration = None
+        self.thumbnail = None
+        self.queue = None  # 들어가 있는 GuildQueue (대기열 합계 갱신용)
+
+    def set_metadata(self, data):
+        title = data.get("title") or self.query
+        duration = data.get("duration")
+        thumbnail = data.get("thumbnail")
+        if (title, duration, thumbnail) == (self.title, self.duration, self.thumbnail):
+            return
+
+        old_duration = self.duration
+        self.title = title
+        self.duration = duration
+        self.thumbnail = thumbnail
+        if self.queue is not None:
+            self.queue.metadata_changed(old_duration, duration)
+
+class GuildQueue:
+    def __init__(self, guild_id=None, store=None, max_size=QUEUE_MAX_SIZE, user_limit=QUEUE_USER_LIMIT,
+                 playlist_limit=PLAYLIST_USER_LIMIT):
+        self.guild_id = guild_id
+        self.store = store
+        self.entries = deque()
+        self.max_size = max_size
+        self.user_limit = user_limit
+        self.playlist_limit = playlist_limit
+        self.user_counts = {}
+        self.version = 0  # 바뀔 때마다 증가 → !q 페이지 캐시 무효화
+        # !q 푸터용 합계 (매번 전체를 더하지 않도록 넣고 뺄 때마다 갱신)
+        self.queued_duration = 0
+        self.unknown = 0  # 길이 모르는 곡 수
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __getitem__(self, index):
+        return self.entries[index]
+
+    def _check(self, requester_id, count=1, user_limit=None):
+        if len(self.entries) + count > self.max_size:
+            raise QueueFull(f"대기열이 가득 찼습니다. (최대 {self.max_size}곡)")
+
+        if user_limit is None:
+            user_limit = self.user_limit
+        if user_limit and self.user_counts.get(requester_id, 0) + count > user_limit:
+            raise QueueFull(f"한 사람당 최대 {user_limit}곡까지 추가할 수 있습니다.")
+
+    def _count(self, entry, delta):
+        requester_id = entry.requester_id
+        count = self.user_counts.get(requester_id, 0) + delta
+        if count > 0:
+            self.user_counts[requester_id] = count
+        else:
+            self.user_counts.pop(requester_id, None)
+
+        entry.queue = self if delta > 0 else None
+        self._add_duration(entry.duration, delta)
 
-        data = await loop.run_in_executor(
-            None, lambda: ytdl.extract_info(query, download=False)
+    def _add_duration(self, duration, delta):
+        if duration:
+            self.queued_duration += duration * delta
+        else:
+            self.unknown += delta
+
+    def metadata_changed(self, old_duration, duration):
+        # 대기 중인 곡의 정보가 새로 채워졌을 때 (QueueEntry.set_metadata 에서)
+        self._add_duration(old_duration, -1)
+        self._add_duration(duration, 1)
+        self.version += 1
+
+    def push(self, entry, user_limit=None):
+        self._check(entry.requester_id, user_limit=user_limit)
+        self.entries.append(entry)
+        self._count(entry, 1)
+        self.version += 1
+
+        if self.store:
+            entry.entry_id = self.store.new_id(entry.guild_id)
+            self.store.pushed(entry)
+
+    def restore(self, entries):
+        # 저장돼 있던 대기열 복구 (제한 검사/저장 없이)
+        for entry in entries:
+            self.entries.append(entry)
+            self._count(entry, 1)
+        self.version += 1
+
+    def extend(self, entries):
+        # 플레이리스트용: 들어갈 수 있는 만큼만 넣고 넣은 개수를 돌려줌
+        added = 0
+        for entry in entries:
+            try:
+                self.push(entry, user_limit=self.playlist_limit)
+            except QueueFull:
+                break
+            added += 1
+        return added
+
+    def popleft(self):
+        entry = self.entries.popleft()
+        self._count(entry, -1)
+        self.version += 1
+        if self.store:
+            self.store.popped(entry)
+        return entry
+
+    def remove_at(self, index):
+        entry = self.entries[index]
+        del self.entries[index]
+        self._count(entry, -1)
+        self.version += 1
+        if self.store:
+            self.store.popped(entry)
+        return entry
+
+    def head(self, count):
+        return list(islice(self.entries, count))
+
+    def page(self, start, count):
+        # deque 는 인덱스 접근이 블록 단위라 앞에서부터 세는 것보다 빠름
+        return [self.entries[i] for i in range(start, min(start + count, len(self.entries)))]
+
+    def snapshot(self):
+        return tuple(self.entries)
+
+    def clear(self):
+        for entry in self.entries:
+            entry.queue = None
+        self.entries.clear()
+        self.user_counts.clear()
+        self.queued_duration = 0
+        self.unknown = 0
+        self.version += 1
+        if self.store:
+            self.store.cleared(self.guild_id)
+
+# =========================
+# 대기열 표시용 메타데이터 (제목/길이/썸네일)
+# 재생용 추출과 별개로, 화면에 보이는 곡만 스레드 하나로 천천히 조회
+# =========================
+METADATA_CACHE_SIZE = 2048
+METADATA_WAIT = 5   # !q 메시지를 고치기 전에 기다리는 최대 시간(초)
+QUEUE_PAGE_SIZE = 10  # !q 한 페이지에 보여줄 곡 수
+
+def extract_metadata(query):
+    if not urlparse(query).scheme:
+        query = f"ytsearch1:{query}"
+
+    # process=False → 포맷 선택/스트림 URL 처리 없이 기본 정보만
+    info = worker_flat_ytdl().extract_info(query, download=False, process=False)
+    if "entries" in info:
+        info = next(iter(info["entries"]), None) or {}
+
+    return compact_metadata(info)
+
+def format_duration(seconds):
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return f"{h}:{m:02}:{s:02}" if h else f"{m:02}:{s:02}"
+
+class MetadataResolver:
+    def __init__(self, max_size=METADATA_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.flight = SingleFlight()
+        self.executor = None
+
+    def cached(self, key):
+        meta = self.entries.get(key)
+        if meta is not None:
+            self.entries.move_to_end(key)
+            return meta
+
+        # 재생용으로 이미 추출한 곡이면 그 정보를 그대로 사용
+        cached = track_cache.entries.get(key)
+        if cached is not None:
+            return compact_metadata(cached[1])
+        return None
+
+    def _put(self, key, meta):
+        self.entries[key] = meta
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def _lookup(self, key, query):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ytdl-meta")
+
+        loop = asyncio.get_running_loop()
+        meta = await loop.run_in_executor(self.executor, extract_metadata, query)
+        self._put(key, meta)
+        return meta
+
+    async def _fill_one(self, entry):
+        key = track_cache_key(entry.query)
+        try:
+            meta = await self.flight.do(key, lambda: self._lookup(key, entry.query))
+        except Exception as e:
+            print(f"곡 정보 조회 실패 ({entry.query}): {e}")
+            return
+        entry.set_metadata(meta)
+
+    async def fill(self, entries):
+        pending = []
+        for entry in entries:
+            if entry.title is not None:
+                continue
+
+            meta = self.cached(track_cache_key(entry.query))
+            if meta is not None:
+                entry.set_metadata(meta)
+            else:
+                pending.append(entry)
+
+        if pending:
+            await asyncio.gather(*(self._fill_one(entry) for entry in pending))
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+metadata_resolver = MetadataResolver()
+
+# =========================
+# 대기열 저장 / 재시작 후 이어서 재생 (SQLite)
+# =========================
+STATE_DB = os.getenv("STATE_DB", "music_state.db")
+STATE_FLUSH_DELAY = 0.5       # 변경 사항을 모아서 저장하는 간격(초)
+POSITION_SAVE_INTERVAL = 10   # 재생 위치 저장 주기(초)
+
+class SavedPlayback:
+    __slots__ = ("guild_id", "voice_channel_id", "channel_id", "requester_id", "query", "position")
+
+    def __init__(self, guild_id, voice_channel_id, channel_id, requester_id, query, position):
+        self.guild_id = guild_id
+        self.voice_channel_id = voice_channel_id
+        self.channel_id = channel_id
+        self.requester_id = requester_id
+        self.query = query
+        self.position = position
+
+class QueueStore:
+    def __init__(self, path=STATE_DB):
+        self.path = path
+        self.conn = None
+        # sqlite 연결은 항상 같은 스레드 하나에서만 사용
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-db")
+        self.ops = []
+        self.flush_handle = None
+        self.lock = asyncio.Lock()
+        self.next_ids = {}  # guild_id → 다음 순번
+        self.frozen = False
+        self.saved_queues = {}
+        self.saved_playback = {}
+
+    # ---- executor 스레드에서 실행 ----
+    def _open(self):
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # 여러 워커가 같은 파일을 쓰므로 순번은 서버(guild)별로 따로 매김
+        # 서버 하나는 한 워커만 맡으니 (guild_id, entry_id) 는 겹치지 않음
+        columns = self.conn.execute("PRAGMA table_info(queue_entries)").fetchall()
+        if [c[1] for c in columns if c[5]] == ["entry_id"]:
+            # 예전 스키마 (entry_id 단독 키) → 옮겨 담기
+            with self.conn:
+                self.conn.execute("ALTER TABLE queue_entries RENAME TO queue_entries_old")
+                self._create_queue_table()
+                self.conn.execute(
+                    "INSERT INTO queue_entries (guild_id, entry_id, channel_id, requester_id, query)"
+                    " SELECT guild_id, entry_id, channel_id, requester_id, query FROM queue_entries_old"
+                )
+                self.conn.execute("DROP TABLE queue_entries_old")
+        self._create_queue_table()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS playback ("
+            " guild_id INTEGER PRIMARY KEY,"
+            " voice_channel_id INTEGER,"
+            " channel_id INTEGER,"
+            " requester_id INTEGER,"
+            " query TEXT NOT NULL,"
+            " position REAL NOT NULL DEFAULT 0)"
+        )
+        self.conn.commit()
+
+    def _create_queue_table(self):
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS queue_entries ("
+            " guild_id INTEGER NOT NULL,"
+            " entry_id INTEGER NOT NULL,"
+            " channel_id INTEGER,"
+            " requester_id INTEGER,"
+            " query TEXT NOT NULL,"
+            " PRIMARY KEY (guild_id, entry_id))"
+        )
+
+    def _load(self):
+        if self.conn is None:
+            self._open()
+
+        queues = {}
+        for entry_id, guild_id, channel_id, requester_id, query in self.conn.execute(
+            "SELECT entry_id, guild_id, channel_id, requester_id, query"
+            " FROM queue_entries ORDER BY guild_id, entry_id"
+        ):
+            entry = QueueEntry(guild_id, channel_id, requester_id, query)
+            entry.entry_id = entry_id
+            queues.setdefault(guild_id, []).append(entry)
+
+        playback = {
+            row[0]: SavedPlayback(*row)
+            for row in self.conn.execute(
+                "SELECT guild_id, voice_channel_id, channel_id, requester_id, query, position"
+                " FROM playback"
+            )
+        }
+
+        return queues, playback
+
+    def _apply(self, ops):
+        if self.conn is None:
+            self._open()
+
+        with self.conn:
+            for op, *args in ops:
+                if op == "push":
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO queue_entries"
+                        " (guild_id, entry_id, channel_id, requester_id, query)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        args
+                    )
+                elif op == "pop":
+                    self.conn.execute("DELETE FROM queue_entries WHERE guild_id = ? AND entry_id = ?", args)
+                elif op == "clear":
+                    self.conn.execute("DELETE FROM queue_entries WHERE guild_id = ?", args)
+                elif op == "playing":
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO playback"
+                        " (guild_id, voice_channel_id, channel_id, requester_id, query, position)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        args
+                    )
+                elif op == "position":
+                    self.conn.execute("UPDATE playback SET position = ? WHERE guild_id = ?", args)
+                elif op == "stopped":
+                    self.conn.execute("DELETE FROM playback WHERE guild_id = ?", args)
+
+    def _close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    # ---- event loop 쪽 ----
+    async def load(self):
+        loop = asyncio.get_running_loop()
+        self.saved_queues, self.saved_playback = await loop.run_in_executor(
+            self.executor, self._load
         )
+        self.next_ids = {
+            guild_id: entries[-1].entry_id + 1
+            for guild_id, entries in self.saved_queues.items()
+        }
+
+    def take_saved(self):
+        saved = self.saved_queues, self.saved_playback
+        self.saved_queues, self.saved_playback = {}, {}
+        return saved
+
+    def new_id(self, guild_id):
+        entry_id = self.next_ids.get(guild_id, 1)
+        self.next_ids[guild_id] = entry_id + 1
+        return entry_id
+
+    # 변경 기록은 바로 반환하고, 저장은 모아서 나중에
+    def _record(self, op):
+        if self.frozen:
+            return
+
+        self.ops.append(op)
+        if self.flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self.flush_handle = loop.call_later(
+                STATE_FLUSH_DELAY,
+                lambda: asyncio.create_task(self.flush())
+            )
+
+    def pushed(self, entry):
+        self._record(("push", entry.guild_id, entry.entry_id, entry.channel_id, entry.requester_id, entry.query))
+
+    def popped(self, entry):
+        self._record(("pop", entry.guild_id, entry.entry_id))
+
+    def cleared(self, guild_id):
+        self._record(("clear", guild_id))
 
-        if "entries" in data:
-            data = data["entries"][0]
+    def playing(self, guild_id, voice_channel_id, entry):
+        self._record(("playing", guild_id, voice_channel_id, entry.channel_id, entry.requester_id, entry.query, entry.start))
 
-        source = discord.FFmpegPCMAudio(data["url"], **ffmpeg_opts)
-        return cls(source, data=data)
+    def position(self, guild_id, position):
+        self._record(("position", position, guild_id))
+
+    def stopped(self, guild_id):
+        self._record(("stopped", guild_id))
+
+    def freeze(self):
+        # 종료 중에는 음성 연결이 끊기면서 생기는 변경을 저장하지 않음
+        self.frozen = True
+
+    async def flush(self):
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        async with self.lock:
+            ops, self.ops = self.ops, []
+            if not ops:
+                return
+
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(self.executor, self._apply, ops)
+            except sqlite3.Error as e:
+                print(f"대기열 저장 실패: {e}")
+
+    async def close(self):
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._close)
+        self.executor.shutdown(wait=False)
+
+queue_store = QueueStore()
+
+# =========================
+# 재생 위치 저장
+# =========================
+def save_playback_positions():
+    for vc in bot.voice_clients:
+        source = vc.source
+        if isinstance(source, TrackMetadata):
+            queue_store.position(vc.guild.id, source.position)
+
+@tasks.loop(seconds=POSITION_SAVE_INTERVAL)
+async def save_playback_positions_task():
+    save_playback_positions()
 
 # =========================
 # Button Control
 # =========================
+# custom_id 에 서버 ID 를 넣고, 클릭 시점에 그 서버의 voice_client 를 찾음
+# → bot.add_dynamic_items 로 한 번만 등록하면 재시작 후에도 버튼이 동작
+def stop_playback(vc):
+    # 사용자가 멈춘 곡이라고 표시한 뒤 정지 (player_loop 가 403 재시도와 구분)
+    if isinstance(vc.source, TrackMetadata):
+        vc.source.stopped = True
+    vc.stop()
+
+class PlayerButton(
+    discord.ui.DynamicItem[discord.ui.Button],
+    template=r"music:(?P<action>pause|skip):(?P<guild_id>[0-9]+)"
+):
+    STYLES = {
+        "pause": ("⏯", discord.ButtonStyle.primary),
+        "skip": ("⏭", discord.ButtonStyle.secondary),
+    }
+
+    def __init__(self, action, guild_id):
+        label, style = self.STYLES[action]
+        super().__init__(
+            discord.ui.Button(
+                label=label,
+                style=style,
+                custom_id=f"music:{action}:{guild_id}"
+            )
+        )
+        self.action = action
+        self.guild_id = guild_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match["action"], int(match["guild_id"]))
+
+    async def callback(self, interaction):
+        guild = interaction.client.get_guild(self.guild_id)
+        vc = guild.voice_client if guild else None
+
+        if vc and self.action == "pause":
+            if vc.is_playing():
+                vc.pause()
+            elif vc.is_paused():
+                vc.resume()
+        elif vc and self.action == "skip":
+            if vc.is_playing() or vc.is_paused():
+                stop_playback(vc)
+
+        await interaction.response.defer()
+
 class PlayerControls(discord.ui.View):
-    def __init__(self, vc):
+    def __init__(self, guild_id):
         super().__init__(timeout=None)
-        self.vc = vc
-
-    @discord.ui.button(label="⏯", style=discord.ButtonStyle.primary)
-    async def pause_resume(self, interaction, button):
-        if self.vc.is_playing():
-            self.vc.pause()
-        elif self.vc.is_paused():
-            self.vc.resume()
-        await interaction.response.defer()
+        self.add_item(PlayerButton("pause", guild_id))
+        self.add_item(PlayerButton("skip", guild_id))
+
+        # 버튼 모양만 전달하는 용도. 멈춘 뷰는 메시지마다 view store 에 쌓이지 않음
+        self.stop()
+
+class QueuePageButton(
+    discord.ui.DynamicItem[discord.ui.Button],
+    template=r"queue:(?P<action>prev|next):(?P<guild_id>[0-9]+):(?P<page>[0-9]+)"
+):
+    LABELS = {"prev": "◀", "next": "▶"}
+
+    def __init__(self, action, guild_id, page, disabled=False):
+        super().__init__(
+            discord.ui.Button(
+                label=self.LABELS[action],
+                style=discord.ButtonStyle.secondary,
+                custom_id=f"queue:{action}:{guild_id}:{page}",
+                disabled=disabled
+            )
+        )
+        self.guild_id = guild_id
+        self.page = page
 
-    @discord.ui.button(label="⏭", style=discord.ButtonStyle.secondary)
-    async def skip(self, interaction, button):
-        if self.vc.is_playing() or self.vc.is_paused():
-            self.vc.stop()
-        await interaction.response.defer()
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match["action"], int(match["guild_id"]), int(match["page"]))
+
+    async def callback(self, interaction):
+        music = interaction.client.get_cog("Music")
+        guild = interaction.client.get_guild(self.guild_id)
+        if not music or not guild:
+            await interaction.response.defer()
+            return
+
+        await music.flip_queue_page(interaction, guild, self.page)
+
+class QueuePageControls(discord.ui.View):
+    def __init__(self, guild_id, page, page_count):
+        super().__init__(timeout=None)
+        self.add_item(QueuePageButton("prev", guild_id, max(page - 1, 0), disabled=page == 0))
+        self.add_item(QueuePageButton("next", guild_id, min(page + 1, page_count - 1), disabled=page >= page_count - 1))
+        self.stop()
+
+# =========================
+# Now Playing 메시지 관리
+# =========================
+NOW_PLAYING_EDIT_INTERVAL = 1.5  # 같은 서버의 메시지 갱신 최소 간격(초)
+NOW_PLAYING_TRACK_AFTER = 50     # 재생 메시지 뒤에 올라온 메시지를 기억하는 최대 개수 (넘으면 밀려난 걸로 봄)
+TRANSIENT_MESSAGE_TRACK = 4096   # 곧 지워지거나 이미 지워진 메시지 id 를 기억하는 개수
+
+class TransientMessages:
+    # 전용채널 입력 / 명령어 / delete_after 안내처럼 곧 사라지는 메시지
+    # discord.py 는 삭제돼도 last_message_id 를 되돌리지 않으므로 따로 기억함
+    def __init__(self, max_size=TRANSIENT_MESSAGE_TRACK):
+        self.max_size = max_size
+        self.ids = OrderedDict()
+
+    def __contains__(self, message_id):
+        return message_id in self.ids
+
+    def add(self, message_id):
+        self.ids[message_id] = None
+        self.ids.move_to_end(message_id)
+        while len(self.ids) > self.max_size:
+            self.ids.popitem(last=False)
+
+transient_messages = TransientMessages()
+
+class NowPlayingManager:
+    def __init__(self):
+        self.messages = {}   # guild_id -> Message
+        self.after = {}      # guild_id -> 재생 메시지 뒤에 올라온 메시지 id 들
+        self.pending = {}    # guild_id -> (channel, embed, view) 마지막 요청만 유지
+        self.tasks = {}      # guild_id -> flush Task
+        self.last_update = {}
+
+    def update(self, guild_id, channel, embed, view):
+        self.pending[guild_id] = (channel, embed, view)
+        if guild_id not in self.tasks:
+            self.tasks[guild_id] = asyncio.create_task(self._flush(guild_id))
+
+    async def _flush(self, guild_id):
+        try:
+            while guild_id in self.pending:
+                # 연속 스킵은 간격 안에서 마지막 곡 하나로 합쳐짐
+                wait = self.last_update.get(guild_id, 0) + NOW_PLAYING_EDIT_INTERVAL - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+                channel, embed, view = self.pending.pop(guild_id)
+                await self._apply(guild_id, channel, embed, view)
+                self.last_update[guild_id] = time.monotonic()
+        finally:
+            self.tasks.pop(guild_id, None)
+
+    def observe(self, message):
+        # 재생 메시지가 있는 채널에 새 메시지가 올라오면 기록 (on_message 에서)
+        msg = self.messages.get(message.guild.id)
+        if msg is None or msg.channel.id != message.channel.id or msg.id == message.id:
+            return
+
+        after = self.after.setdefault(message.guild.id, [])
+        if len(after) >= NOW_PLAYING_TRACK_AFTER:
+            self._prune(after)
+        if len(after) >= NOW_PLAYING_TRACK_AFTER:
+            return  # 남아 있는 메시지만 이만큼이면 어차피 밀려남
+        after.append(message.id)
+
+    def _prune(self, after):
+        after[:] = [message_id for message_id in after if message_id not in transient_messages]
+
+    def is_last(self, guild_id):
+        # 뒤에 올라온 메시지가 전부 곧 지워지는(또는 지워진) 것들이면 화면상 아직 마지막
+        after = self.after.get(guild_id)
+        if not after:
+            return True
+        self._prune(after)
+        return not after
+
+    async def _apply(self, guild_id, channel, embed, view):
+        msg = self.messages.get(guild_id)
+
+        # 아직 채널의 마지막 메시지면 수정, 밀려났으면 지우고 새로 보냄
+        if msg and msg.channel.id == channel.id and self.is_last(guild_id):
+            try:
+                await msg.edit(embed=embed, view=view)
+                return
+            except discord.HTTPException:
+                pass
+
+        await self._delete(guild_id)
+
+        try:
+            self.messages[guild_id] = await channel.send(embed=embed, view=view)
+        except discord.HTTPException:
+            pass
+
+    async def _delete(self, guild_id):
+        self.after.pop(guild_id, None)
+        old = self.messages.pop(guild_id, None)
+        if old:
+            try:
+                await old.delete()
+            except discord.HTTPException:
+                pass
+
+    async def clear(self, guild_id):
+        self.pending.pop(guild_id, None)
+        self.last_update.pop(guild_id, None)
+
+        task = self.tasks.pop(guild_id, None)
+        if task:
+            task.cancel()
+
+        await self._delete(guild_id)
+
+# =========================
+# 명령어 메시지 삭제 (채널별 묶어서 bulk delete)
+# =========================
+DELETE_FLUSH_INTERVAL = 1.0        # 모아서 지우는 주기(초)
+DELETE_BACKLOG_LIMIT = 300         # 채널별 최대 대기 개수 (넘으면 오래된 것부터 버림)
+BULK_DELETE_MAX_AGE = timedelta(days=14) - timedelta(minutes=5)
+
+class MessageDeleter:
+    def __init__(self):
+        self.pending = {}  # channel_id -> (channel, OrderedDict[message_id, Message])
+        self.task = None
+        self.dropped = 0
+
+    def schedule(self, message):
+        if message.guild is None:
+            return
+
+        transient_messages.add(message.id)
+        channel = message.channel
+        entry = self.pending.get(channel.id)
+        if entry is None:
+            entry = self.pending[channel.id] = (channel, OrderedDict())
+
+        messages = entry[1]
+        messages[message.id] = message
+        if len(messages) > DELETE_BACKLOG_LIMIT:
+            messages.popitem(last=False)
+            self.dropped += 1
+
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            while self.pending:
+                await asyncio.sleep(DELETE_FLUSH_INTERVAL)
+
+                batch, self.pending = self.pending, {}
+                await asyncio.gather(
+                    *(self._delete(channel, list(messages.values()))
+                      for channel, messages in batch.values()),
+                    return_exceptions=True
+                )
+        finally:
+            self.task = None
+
+    async def _delete(self, channel, messages):
+        # bulk delete 는 14일 이내 메시지만 가능
+        cutoff = datetime.now(timezone.utc) - BULK_DELETE_MAX_AGE
+        recent = [m for m in messages if m.created_at > cutoff]
+        old = [m for m in messages if m.created_at <= cutoff]
+
+        for i in range(0, len(recent), 100):
+            try:
+                await channel.delete_messages(recent[i:i + 100])
+            except discord.HTTPException:
+                pass
+
+        for message in old:
+            try:
+                await message.delete()
+            except discord.HTTPException:
+                pass
+
+# =========================
+# 샤드별 음악 상태
+# =========================
+class QueuePages:
+    # 대기열 한 버전에 대한 !q 페이지 캐시 (버전이 바뀌면 통째로 버림)
+    __slots__ = ("version", "embeds")
+
+    def __init__(self, queue):
+        self.version = queue.version
+        self.embeds = {}  # page -> 푸터 없는 Embed
+
+QUEUE_MESSAGE_TRACK = 256  # 샤드마다 지금 보이는 페이지를 기억할 !q 메시지 수
+
+class ShardState:
+    __slots__ = ("queues", "play_tasks", "prefetched", "now_playing", "imports", "queue_pages", "queue_messages")
+
+    def __init__(self):
+        self.queues = {}
+        self.play_tasks = {}
+        self.prefetched = {}
+        self.now_playing = NowPlayingManager()
+        self.imports = {}  # guild_id -> 진행 중인 플레이리스트 가져오기 중단 플래그들
+        self.queue_pages = {}  # guild_id -> QueuePages
+        self.queue_messages = OrderedDict()  # message_id -> 지금 보이는 페이지 (늦게 끝난 갱신이 덮어쓰지 않게)
+
+    def show_queue_page(self, message_id, page):
+        self.queue_messages[message_id] = page
+        self.queue_messages.move_to_end(message_id)
+        while len(self.queue_messages) > QUEUE_MESSAGE_TRACK:
+            self.queue_messages.popitem(last=False)
 
 # =========================
 # Music Cog
@@ -132,22 +1681,156 @@ class PlayerControls(discord.ui.View):
 class Music(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.queues = {}
-        self.play_tasks = {}
-        self.now_playing_message = {}
+        self.shards = {}
+        self.deleter = MessageDeleter()
+        self.transition_gaps = Histogram(GAP_BUCKETS)
+        self.stream_retries = 0
+
+    def shard(self, guild_id):
+        shard_id = (guild_id >> 22) % (self.bot.shard_count or 1)
+        state = self.shards.get(shard_id)
+        if state is None:
+            state = self.shards[shard_id] = ShardState()
+        return state
 
     def get_queue(self, guild_id):
-        return self.queues.setdefault(guild_id, [])
+        queues = self.shard(guild_id).queues
+        queue = queues.get(guild_id)
+        if queue is None:
+            queue = queues[guild_id] = GuildQueue(guild_id, queue_store)
+        return queue
+
+    def clear_queue(self, guild_id):
+        for stop in self.shard(guild_id).imports.pop(guild_id, ()):
+            stop.set()
+        self.cancel_prefetch(guild_id)
+        self.get_queue(guild_id).clear()
+        queue_store.stopped(guild_id)
+
+    # =========================
+    # 재시작 후 이어서 재생
+    # =========================
+    async def resume_saved(self):
+        saved_queues, saved_playback = queue_store.take_saved()
+
+        for guild_id in set(saved_queues) | set(saved_playback):
+            guild = self.bot.get_guild(guild_id)
+            if guild is None:
+                continue  # 다른 클러스터가 맡은 서버
+
+            current = saved_playback.get(guild_id)
+            voice_channel = guild.get_channel(current.voice_channel_id) if current else None
+            if not voice_channel or not any(not m.bot for m in voice_channel.members):
+                self.clear_queue(guild_id)
+                continue
+
+            entries = saved_queues.get(guild_id, [])
+            entry = QueueEntry(guild_id, current.channel_id, current.requester_id, current.query)
+            entry.start = current.position
+            self.get_queue(guild_id).restore([entry, *entries])
+
+            try:
+                if not guild.voice_client:
+                    await voice_channel.connect()
+            except (discord.ClientException, asyncio.TimeoutError):
+                self.clear_queue(guild_id)
+                continue
+
+            play_tasks = self.shard(guild_id).play_tasks
+            if guild_id not in play_tasks:
+                play_tasks[guild_id] = asyncio.create_task(
+                    self.player_loop(guild_id)
+                )
+
+    async def cog_unload(self):
+        # 종료 직전 재생 위치를 남기고, 이후 연결 해제로 생기는 변경은 무시
+        save_playback_positions()
+        queue_store.freeze()
+
+    # =========================
+    # Prefetch (다음 곡 미리 추출)
+    # =========================
+    def prefetch_upcoming(self, guild_id):
+        queue = self.get_queue(guild_id)
+        head = queue.head(PREFETCH_DEPTH)
+
+        # 순서가 바뀌어 앞쪽에서 밀려난 항목은 취소
+        prefetched = self.shard(guild_id).prefetched
+        for item in prefetched.get(guild_id, []):
+            if not any(item is h for h in head):
+                self.drop_prefetch(item)
+
+        for item in head:
+            task = item.prefetch
+            fresh = False
+            if task and task.done():
+                if task.cancelled() or task.exception():
+                    task = None
+                elif stream_expires_soon(task.result()):
+                    task, fresh = None, True
+
+            if task is None:
+                item.prefetch = asyncio.create_task(
+                    YTDLSource.resolve(
+                        item.query,
+                        loop=self.bot.loop,
+                        fresh=fresh
+                    )
+                )
+
+        prefetched[guild_id] = head
+
+    def cancel_prefetch(self, guild_id):
+        for item in self.shard(guild_id).prefetched.pop(guild_id, []):
+            self.drop_prefetch(item)
+
+    def drop_prefetch(self, item):
+        task, item.prefetch = item.prefetch, None
+        if task is None:
+            return
+
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            # 이미 실패로 끝난 Task 는 예외를 꺼내 둬야 버릴 때 "exception was never retrieved" 경고가 안 남음
+            task.exception()
+
+    async def resolve_item(self, item):
+        task, item.prefetch = item.prefetch, None
+        data = None
+
+        if task:
+            try:
+                data = await task
+            except Exception:
+                data = None
+
+        if data is None:
+            data = await YTDLSource.resolve(item.query, loop=self.bot.loop)
+
+        # 대기/캐시 중에 만료가 가까워져서 곡이 끝나기 전에 URL 이 죽을 것 같으면 다시 추출
+        remaining = max(0, (data.get("duration") or 0) - item.start)
+        if stream_expires_soon(data, STREAM_EXPIRE_MARGIN + remaining):
+            data = await YTDLSource.resolve(
+                item.query,
+                loop=self.bot.loop,
+                fresh=True
+            )
+
+        return data
+
+    async def notice(self, ctx, content, delay):
+        # 잠깐 보였다 사라지는 안내 (재생 메시지를 밀어낸 걸로 치지 않음)
+        msg = await ctx.send(content, delete_after=delay)
+        transient_messages.add(msg.id)
+        return msg
 
     # =========================
     # Voice Channel Check
     # =========================
     async def ensure_author_in_voice(self, ctx):
         if not ctx.author.voice:
-            await ctx.send(
-                "❌ 음성 채널에 들어가 있어야 사용할 수 있는 명령어입니다.",
-                delete_after=10
-            )
+            await self.notice(ctx, "❌ 음성 채널에 들어가 있어야 사용할 수 있는 명령어입니다.", 10)
             return False
         return True
 
@@ -171,30 +1854,145 @@ class Music(commands.Cog):
             inline=True
         )
 
-        embed.set_footer(
-            text=requester.display_name,
-            icon_url=requester.display_avatar.url
-        )
+        if requester:
+            embed.set_footer(
+                text=requester.display_name,
+                icon_url=requester.display_avatar.url
+            )
 
         return embed
 
+    def queue_page_count(self, queue):
+        return max(1, -(-len(queue) // QUEUE_PAGE_SIZE))
+
+    def fill_queue_page(self, queue, page):
+        # 이 페이지 곡 중 캐시에 정보가 있는 건 바로 채우고, 아직 모르는 곡이 남았는지 돌려줌
+        # (정보가 실제로 바뀐 곡이 있으면 set_metadata 가 대기열 버전을 올림)
+        entries = queue.page(page * QUEUE_PAGE_SIZE, QUEUE_PAGE_SIZE)
+        missing = False
+        for item in entries:
+            if item.title is not None:
+                continue
+
+            meta = metadata_resolver.cached(track_cache_key(item.query))
+            if meta is not None:
+                item.set_metadata(meta)
+            else:
+                missing = True
+
+        return missing
+
+    def render_queue_page(self, queue, page):
+        embed = discord.Embed(title="🎶 재생목록", color=0x1DB954)
+        entries = queue.page(page * QUEUE_PAGE_SIZE, QUEUE_PAGE_SIZE)
+
+        for idx, item in enumerate(entries, start=page * QUEUE_PAGE_SIZE + 1):
+            value = f"<@{item.requester_id}>"
+            if item.duration:
+                value += f" · {format_duration(item.duration)}"
+            embed.add_field(
+                name=f"{idx}. {(item.title or item.query)[:200]}",
+                value=value,
+                inline=False
+            )
+
+        if entries and entries[0].thumbnail:
+            embed.set_thumbnail(url=entries[0].thumbnail)
+
+        return embed
+
+    def build_queue_message(self, guild, queue, page=0):
+        if not queue:
+            embed = discord.Embed(title="🎶 재생목록", color=0x1DB954)
+            embed.description = "📭 현재 대기중인 곡이 없습니다."
+            return embed, None
+
+        page_count = self.queue_page_count(queue)
+        page = min(max(page, 0), page_count - 1)
+
+        # 대기열 버전이 같으면 렌더링한 페이지를 재사용 (페이지 넘김/반복 !q 는 한 페이지 분량만)
+        cache = self.shard(guild.id).queue_pages
+        pages = cache.get(guild.id)
+        if pages is None or pages.version != queue.version:
+            pages = cache[guild.id] = QueuePages(queue)
+
+        embed = pages.embeds.get(page)
+        if embed is None:
+            embed = pages.embeds[page] = self.render_queue_page(queue, page)
+        embed = embed.copy()
+
+        # 남은 시간 = 지금 곡의 남은 부분 + 길이를 아는 대기곡 (모르는 곡은 따로 표시)
+        remaining = queue.queued_duration
+        vc = guild.voice_client
+        current = vc.source if vc else None
+        if isinstance(current, TrackMetadata) and current.duration:
+            remaining += max(0, current.duration - current.position)
+
+        footer = (
+            f"{page + 1}/{page_count} 페이지 · 총 {len(queue)}곡 · "
+            f"남은 시간 {format_duration(remaining)}"
+        )
+        if queue.unknown:
+            footer += f" (+ 길이 모르는 곡 {queue.unknown}개)"
+        embed.set_footer(text=footer)
+
+        view = QueuePageControls(guild.id, page, page_count) if page_count > 1 else None
+        return embed, view
+
+    async def flip_queue_page(self, interaction, guild, page):
+        queue = self.get_queue(guild.id)
+        page = min(page, self.queue_page_count(queue) - 1)
+        missing = self.fill_queue_page(queue, page)
+
+        embed, view = self.build_queue_message(guild, queue, page)
+        await interaction.response.edit_message(embed=embed, view=view)
+        self.shard(guild.id).show_queue_page(interaction.message.id, page)
+
+        if missing:
+            asyncio.create_task(self.refresh_queue_message(interaction.message, guild, queue, page))
+
+    async def refresh_queue_message(self, msg, guild, queue, page):
+        # 화면에 보이는 곡만 백그라운드에서 조회한 뒤 메시지를 한 번 고침
+        entries = queue.page(page * QUEUE_PAGE_SIZE, QUEUE_PAGE_SIZE)
+        version = queue.version
+        try:
+            await asyncio.wait_for(metadata_resolver.fill(entries), METADATA_WAIT)
+        except asyncio.TimeoutError:
+            pass
+
+        # 새로 알게 된 게 없거나, 그 사이 사용자가 다른 페이지로 넘겼으면 고치지 않음
+        if queue.version == version:
+            return
+        if self.shard(guild.id).queue_messages.get(msg.id, page) != page:
+            return
+
+        embed, view = self.build_queue_message(guild, queue, page)
+        try:
+            await msg.edit(embed=embed, view=view)
+        except discord.HTTPException:
+            pass
+
     # =========================
     # Message Cleanup
     # =========================
     async def cleanup_now_playing(self, guild_id):
-        old = self.now_playing_message.pop(guild_id, None)
-        if old:
-            try:
-                await old.delete()
-            except:
-                pass
+        await self.shard(guild_id).now_playing.clear(guild_id)
 
     # =========================
     # Safe Play
     # =========================
-    def safe_play(self, vc, source):
+    def safe_play(self, vc, source, done):
+        loop = self.bot.loop
+
+        # after 콜백은 음성 스레드에서 불리므로 loop 로 넘겨서 이벤트를 세팅
+        def after(error):
+            try:
+                loop.call_soon_threadsafe(done.set)
+            except RuntimeError:
+                pass  # 종료 중 loop 가 이미 닫힘
+
         try:
-            vc.play(source)
+            vc.play(source, after=after)
             return True
         except discord.ClientException:
             return False
@@ -204,58 +2002,157 @@ class Music(commands.Cog):
     # =========================
     async def player_loop(self, guild_id):
         guild = self.bot.get_guild(guild_id)
+        last_end = None
+        retry = None
+        retries = 0
 
         try:
             while True:
                 queue = self.get_queue(guild_id)
-                if not queue:
-                    break
-
-                item = queue.pop(0)
+                if retry is None:
+                    if not queue:
+                        break
+                    item = queue.popleft()
+                    retries = 0
 
                 vc = guild.voice_client
                 if not vc or not vc.is_connected():
                     break
 
-                source = await YTDLSource.from_query(
-                    item["query"],
-                    loop=self.bot.loop
-                )
+                resumed = retry is not None
+                retry = None
+                try:
+                    if resumed:
+                        # 403 으로 끊긴 곡 → 새 URL 로 끊긴 위치부터 (지금 재생 메시지는 그대로 둠)
+                        data = await YTDLSource.resolve(item.query, loop=self.bot.loop, fresh=True)
+                    else:
+                        data = await self.resolve_item(item)
+                    source = YTDLSource.from_data(data, start=item.start)
+                except Exception as e:
+                    # 곡 하나가 실패해도 (삭제/비공개/지역 제한 등) 다음 곡으로
+                    print(f"곡 추출 실패, 건너뜀: {item.query} ({e})")
+                    last_end = None
+                    continue
+
+                text_channel = guild.get_channel_or_thread(item.channel_id)  # ✅ 요청 채널 사용
+                if text_channel and not resumed:
+                    embed = self.build_now_playing_embed(
+                        source,
+                        guild.get_member(item.requester_id)
+                    )
+                    self.shard(guild_id).now_playing.update(
+                        guild_id,
+                        text_channel,
+                        embed,
+                        PlayerControls(guild_id)
+                    )
+
+                done = asyncio.Event()
+                if not self.safe_play(vc, source, done):
+                    break
 
-                embed = self.build_now_playing_embed(
-                    source,
-                    item["requester"]
-                )
+                queue_store.playing(guild_id, vc.channel.id, item)
 
-                await self.cleanup_now_playing(guild_id)
+                if last_end is not None:
+                    self.transition_gaps.observe(time.perf_counter() - last_end)
 
-                text_channel = item["channel"]  # ✅ 요청 채널 사용
-                msg = await text_channel.send(
-                    embed=embed,
-                    view=PlayerControls(vc)
-                )
-                self.now_playing_message[guild_id] = msg
+                # 현재 곡이 재생되는 동안 다음 곡들을 미리 추출
+                self.prefetch_upcoming(guild_id)
 
-                if not self.safe_play(vc, source):
-                    break
+                await done.wait()
+                last_end = time.perf_counter()
+
+                # ⏭ / !stop 으로 멈춘 곡은 403 이 찍혀 있어도 다시 틀지 않음
+                if source.stopped:
+                    continue
 
-                while vc.is_playing() or vc.is_paused():
-                    await asyncio.sleep(0.5)
+                # after 콜백은 ffmpeg 정리 전에 불리므로 stderr 를 끝까지 읽은 뒤에 판단
+                await self.bot.loop.run_in_executor(None, source.errors.wait)
+
+                # ffmpeg 이 만료된 URL 때문에 혼자 일찍 끝났으면 건너뛰지 않고 다시 추출해서 이어서 재생
+                if source.errors.forbidden and retries < STREAM_RETRY_LIMIT:
+                    print(f"스트림 URL 만료(403), 다시 추출해서 {source.position:.0f}초부터 이어서 재생: {item.query}")
+                    item.start = source.position
+                    retry = item
+                    retries += 1
+                    self.stream_retries += 1
+                    last_end = None
+                    continue
+
+            queue_store.stopped(guild_id)
 
         except asyncio.CancelledError:
             pass
         finally:
-            self.play_tasks.pop(guild_id, None)
+            self.shard(guild_id).play_tasks.pop(guild_id, None)
+            self.cancel_prefetch(guild_id)
+
+    def start_player(self, guild_id):
+        play_tasks = self.shard(guild_id).play_tasks
+        if guild_id not in play_tasks:
+            play_tasks[guild_id] = asyncio.create_task(
+                self.player_loop(guild_id)
+            )
+        else:
+            self.prefetch_upcoming(guild_id)
+
+    # =========================
+    # Playlist Import
+    # =========================
+    async def import_playlist(self, ctx, query):
+        guild_id = ctx.guild.id
+        queue = self.get_queue(guild_id)
+        imports = self.shard(guild_id).imports
+        stop = threading.Event()
+        imports.setdefault(guild_id, set()).add(stop)
+        added = 0
+        full = False
+
+        # 곡 URL 만 대기열에 넣고, 실제 추출은 대기열 앞쪽에 왔을 때 prefetch 가 처리
+        def on_chunk(items):
+            nonlocal added, full
+            if stop.is_set():
+                return
+
+            entries = []
+            for data in items:
+                entry = QueueEntry(guild_id, ctx.channel.id, ctx.author.id, data["url"])
+                entry.set_metadata(data)
+                entries.append(entry)
+            count = queue.extend(entries)
+            if count < len(entries):
+                full = True
+                stop.set()
+
+            if count:
+                added += count
+                self.start_player(guild_id)
+
+        try:
+            await extractor.stream_playlist(query, on_chunk, stop)
+        except Exception as e:
+            print(f"플레이리스트 불러오기 실패: {e}")
+            if not added:
+                await self.notice(ctx, "❌ 플레이리스트를 불러오지 못했습니다.", 10)
+                return
+        finally:
+            stops = imports.get(guild_id)
+            if stops is not None:
+                stops.discard(stop)
+                if not stops:
+                    del imports[guild_id]
+
+        if full:
+            await self.notice(ctx, "⚠️ 대기열 제한에 걸려 나머지 곡은 추가하지 않았습니다.", 10)
+        if added:
+            await self.notice(ctx, f"📃 플레이리스트에서 {added}곡을 추가했습니다.", 10)
 
     # =========================
     # Commands
     # =========================
     @commands.command(aliases=["p"])
     async def play(self, ctx, *, query):
-        try:
-            await ctx.message.delete()
-        except:
-            pass
+        self.deleter.schedule(ctx.message)
 
         if not await self.ensure_author_in_voice(ctx):
             return
@@ -263,45 +2160,43 @@ class Music(commands.Cog):
         if not ctx.voice_client:
             await ctx.author.voice.channel.connect()
 
-        self.get_queue(ctx.guild.id).append({
-            "query": query,
-            "requester": ctx.author,
-            "channel": ctx.channel   # ✅ 추가
-        })
+        if youtube_playlist_id(query):
+            await self.import_playlist(ctx, query)
+            return
 
-        if ctx.guild.id not in self.play_tasks:
-            self.play_tasks[ctx.guild.id] = asyncio.create_task(
-                self.player_loop(ctx.guild.id)
+        try:
+            self.get_queue(ctx.guild.id).push(
+                QueueEntry(
+                    ctx.guild.id,
+                    ctx.channel.id,
+                    ctx.author.id,
+                    query
+                )
             )
+        except QueueFull as e:
+            await self.notice(ctx, f"❌ {e}", 10)
+            return
+
+        self.start_player(ctx.guild.id)
 
     @commands.command(aliases=["q", "queue", "재생목록", "플리", "list"])
     async def queue_list(self, ctx):
-        try:
-            await ctx.message.delete()
-        except:
-            pass
+        self.deleter.schedule(ctx.message)
 
         queue = self.get_queue(ctx.guild.id)
-        embed = discord.Embed(title="🎶 재생목록", color=0x1DB954)
+        missing = self.fill_queue_page(queue, 0)
 
-        if not queue:
-            embed.description = "📭 현재 대기중인 곡이 없습니다."
-        else:
-            for idx, item in enumerate(queue, start=1):
-                embed.add_field(
-                    name=f"{idx}️⃣ {item['query']}",
-                    value=item["requester"].display_name,
-                    inline=False
-                )
+        # 정보가 없는 곡은 일단 검색어로 보여주고, 조회가 끝나면 한 번 고침
+        embed, view = self.build_queue_message(ctx.guild, queue)
+        msg = await ctx.send(embed=embed, view=view)
+        self.shard(ctx.guild.id).show_queue_page(msg.id, 0)
 
-        await ctx.send(embed=embed)
+        if missing:
+            asyncio.create_task(self.refresh_queue_message(msg, ctx.guild, queue, 0))
 
     @commands.command()
     async def stop(self, ctx):
-        try:
-            await ctx.message.delete()
-        except:
-            pass
+        self.deleter.schedule(ctx.message)
 
         if not await self.ensure_author_in_voice(ctx):
             return
@@ -311,13 +2206,13 @@ class Music(commands.Cog):
             return
 
         if vc.is_playing() or vc.is_paused():
-            vc.stop()
+            stop_playback(vc)
 
         # 🗑 큐 초기화
-        self.get_queue(ctx.guild.id).clear()
+        self.clear_queue(ctx.guild.id)
 
         # 재생 루프 종료
-        task = self.play_tasks.pop(ctx.guild.id, None)
+        task = self.shard(ctx.guild.id).play_tasks.pop(ctx.guild.id, None)
         if task:
             task.cancel()
 
@@ -326,10 +2221,7 @@ class Music(commands.Cog):
 
     @commands.command()
     async def join(self, ctx):
-        try:
-            await ctx.message.delete()
-        except:
-            pass
+        self.deleter.schedule(ctx.message)
 
         if not await self.ensure_author_in_voice(ctx):
             return
@@ -341,10 +2233,7 @@ class Music(commands.Cog):
 
     @commands.command()
     async def leave(self, ctx):
-        try:
-            await ctx.message.delete()
-        except:
-            pass
+        self.deleter.schedule(ctx.message)
 
         vc = ctx.voice_client
         if not vc:
@@ -353,9 +2242,9 @@ class Music(commands.Cog):
         await vc.disconnect()
 
         # 큐 / 태스크 / 메시지 정리
-        self.get_queue(ctx.guild.id).clear()
+        self.clear_queue(ctx.guild.id)
 
-        task = self.play_tasks.pop(ctx.guild.id, None)
+        task = self.shard(ctx.guild.id).play_tasks.pop(ctx.guild.id, None)
         if task:
             task.cancel()
 
@@ -366,51 +2255,34 @@ class Music(commands.Cog):
     # =========================
     @commands.command(name="채널추가")
     async def add_music_channel(self, ctx):
-        try:
-            await ctx.message.delete()
-        except:
-            pass
-
-        channels = load_music_channels()
-        channel_id = ctx.channel.id
+        self.deleter.schedule(ctx.message)
 
-        if channel_id in channels:
-            await ctx.send("이미 추가된 채널입니다.", delete_after=5)
+        if not music_channels.add(ctx.channel.id):
+            await self.notice(ctx, "이미 추가된 채널입니다.", 5)
             return
 
-        channels.add(channel_id)
-        save_music_channels(channels)
+        await cluster.send({"op": "music_channels", "action": "add", "channel_id": ctx.channel.id})
 
-        await ctx.send("전용채널로 추가되었습니다.", delete_after=5)
+        await self.notice(ctx, "전용채널로 추가되었습니다.", 5)
 
     @commands.command(name="채널삭제")
     async def remove_music_channel(self, ctx):
-        try:
-            await ctx.message.delete()
-        except:
-            pass
+        self.deleter.schedule(ctx.message)
 
-        channels = load_music_channels()
-        channel_id = ctx.channel.id
-
-        if channel_id not in channels:
-            await ctx.send("전용채널이 아닙니다.", delete_after=5)
+        if not music_channels.remove(ctx.channel.id):
+            await self.notice(ctx, "전용채널이 아닙니다.", 5)
             return
 
-        channels.remove(channel_id)
-        save_music_channels(channels)
+        await cluster.send({"op": "music_channels", "action": "remove", "channel_id": ctx.channel.id})
 
-        await ctx.send("전용채널에서 삭제되었습니다.", delete_after=5)
+        await self.notice(ctx, "전용채널에서 삭제되었습니다.", 5)
 
     # =========================
     # 도움말
     # =========================
     @commands.command(name="help", aliases=["도움말"])
     async def help_command(self, ctx):
-        try:
-            await ctx.message.delete()
-        except:
-            pass
+        self.deleter.schedule(ctx.message)
 
         embed = discord.Embed(
             title="🎶 음악봇 사용법",
@@ -474,12 +2346,13 @@ class Music(commands.Cog):
     # =========================
     @commands.Cog.listener()
     async def on_message(self, message):
+        if message.guild is not None:
+            self.shard(message.guild.id).now_playing.observe(message)
+
         if message.author.bot:
             return
 
-        channels = load_music_channels()
-
-        if message.channel.id not in channels:
+        if message.channel.id not in music_channels:
             return
 
         content = message.content.strip()
@@ -487,10 +2360,7 @@ class Music(commands.Cog):
             return
 
         # 전용 채널: 메시지 삭제
-        try:
-            await message.delete()
-        except:
-            pass
+        self.deleter.schedule(message)
 
         # !로 시작하면 기존 명령어에 맡김 (아무 것도 안 함)
         if content.startswith("!"):
@@ -510,6 +2380,15 @@ class Music(commands.Cog):
         await play_cmd.callback(self, ctx, query=content)
 
 
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload):
+        transient_messages.add(payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload):
+        for message_id in payload.message_ids:
+            transient_messages.add(message_id)
+
     # =========================
     # Auto leave
     # =========================
@@ -524,14 +2403,154 @@ class Music(commands.Cog):
                 humans = [m for m in before.channel.members if not m.bot]
                 if not humans:
                     await vc.disconnect()
-                    self.get_queue(member.guild.id).clear()
+                    self.clear_queue(member.guild.id)
 
-                    task = self.play_tasks.pop(member.guild.id, None)
+                    task = self.shard(member.guild.id).play_tasks.pop(member.guild.id, None)
                     if task:
                         task.cancel()
 
                     await self.cleanup_now_playing(member.guild.id)
 
+# =========================
+# Event loop 지연 모니터
+# =========================
+LOOP_MONITOR_INTERVAL = 0.05                                        # 센티넬 주기(초)
+LOOP_STALL_THRESHOLD = float(os.getenv("LOOP_STALL_THRESHOLD", "0.1"))  # 이보다 오래 막히면 스택 기록(초)
+LOOP_DEBUG = os.getenv("LOOP_DEBUG") == "1"
+
+class LoopMonitor:
+    def __init__(self):
+        self.lag = Histogram(LAG_BUCKETS)
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.last_tick = None
+        self.loop_thread_id = None
+        self.task = None
+
+    def start(self):
+        self.loop_thread_id = threading.get_ident()
+        self.task = asyncio.create_task(self._run())
+
+        if LOOP_DEBUG:
+            threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    async def _run(self):
+        while True:
+            self.last_tick = time.monotonic()
+            expected = time.perf_counter() + LOOP_MONITOR_INTERVAL
+            await asyncio.sleep(LOOP_MONITOR_INTERVAL)
+
+            lag = max(0.0, time.perf_counter() - expected)
+            self.lag.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def _watch(self):
+        # 별도 스레드에서 센티넬이 멈췄는지 보고, 멈췄으면 loop 스레드의 현재 스택을 찍음
+        reported = None
+        while True:
+            time.sleep(LOOP_STALL_THRESHOLD / 2)
+            last_tick = self.last_tick
+            if last_tick is None or last_tick == reported:
+                continue
+
+            stalled = time.monotonic() - last_tick - LOOP_MONITOR_INTERVAL
+            if stalled < LOOP_STALL_THRESHOLD:
+                continue
+
+            reported = last_tick
+            self.stalls += 1
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            print(
+                f"⚠️ event loop 가 {stalled * 1000:.0f}ms 이상 막혀 있음 "
+                f"(gateway latency {bot.latency * 1000:.0f}ms)\n{stack}"
+            )
+
+loop_monitor = LoopMonitor()
+
+# =========================
+# 메트릭 엔드포인트 (METRICS_PORT 를 지정했을 때만)
+# =========================
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+def counter_lines(name, counts, label_names):
+    return [
+        name + "{" + ",".join(f'{label}="{value}"' for label, value in zip(label_names, key)) + "}" + f" {count}"
+        for key, count in sorted(counts.items())
+    ]
+
+def render_metrics():
+    # 수집은 전부 여기서 (요청이 올 때만 계산)
+    lines = loop_monitor.lag.render("bot_event_loop_lag_seconds")
+    lines.append(f"bot_event_loop_lag_max_seconds {loop_monitor.max_lag}")
+    lines.append(f"bot_event_loop_stalls_total {loop_monitor.stalls}")
+
+    for shard_id, latency in bot.latencies:
+        if latency == latency and latency != float("inf"):  # 연결 전에는 nan/inf
+            lines.append(f'discord_gateway_latency_seconds{{shard="{shard_id}"}} {latency}')
+
+    # 샤드별 음성 연결 수
+    voice = dict.fromkeys(bot.shards, 0)
+    for vc in bot.voice_clients:
+        shard_id = vc.guild.shard_id
+        voice[shard_id] = voice.get(shard_id, 0) + 1
+    for shard_id, count in sorted(voice.items()):
+        lines.append(f'bot_voice_connections{{shard="{shard_id}"}} {count}')
+
+    # 대기열 길이 분포 / 곡 전환 간격
+    music = bot.get_cog("Music")
+    if music:
+        for shard_id, state in sorted(music.shards.items()):
+            depth = Histogram(QUEUE_DEPTH_BUCKETS)
+            for queue in list(state.queues.values()):
+                depth.observe(len(queue))
+            lines += depth.render("bot_queue_depth", f'shard="{shard_id}"')
+        lines += music.transition_gaps.render("bot_track_transition_gap_seconds")
+        lines.append(f"bot_message_delete_dropped_total {music.deleter.dropped}")
+        lines.append(f"bot_stream_403_retries_total {music.stream_retries}")
+
+    # yt-dlp 추출
+    lines += extractor.latency.render("bot_ytdl_resolve_seconds")
+    lines.append(f"bot_ytdl_completed_total {extractor.completed}")
+    lines.append(f"bot_ytdl_failed_total {extractor.failed}")
+    lines.append(f"bot_ytdl_waiting {extractor.waiting}")
+    lines.append(f"bot_ytdl_in_flight {extractor.submitted}")
+
+    # 캐시 / single-flight
+    lookups = track_cache.hits + track_cache.misses
+    lines.append(f"bot_track_cache_hits_total {track_cache.hits}")
+    lines.append(f"bot_track_cache_misses_total {track_cache.misses}")
+    lines.append(f"bot_track_cache_hit_ratio {track_cache.hits / lookups if lookups else 0.0}")
+    lines.append(f"bot_track_cache_entries {len(track_cache.entries)}")
+    lines.append(f"bot_resolve_calls_total {resolve_flight.calls}")
+    lines.append(f"bot_resolve_collapsed_total {resolve_flight.collapsed}")
+
+    # 디스코드 REST
+    lines += counter_lines(
+        "discord_rest_requests_total", rest_stats.calls, ("method", "route")
+    )
+    lines += counter_lines(
+        "discord_rest_429_total", rest_stats.rate_limited, ("method", "route")
+    )
+
+    return "\n".join(lines) + "\n"
+
+async def metrics_handler(request):
+    return web.Response(text=render_metrics(), content_type="text/plain")
+
+async def start_metrics_server():
+    if not METRICS_PORT:
+        return None
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    # 클러스터로 띄우면 프로세스마다 포트를 하나씩 밀어서 사용
+    await web.TCPSite(runner, METRICS_HOST, METRICS_PORT + CLUSTER_ID).start()
+    return runner
+
 # =========================
 # Run
 # =========================
@@ -543,9 +2562,47 @@ async def on_ready():
     if not update_server_count.is_running():
         update_server_count.start()
 
+    if not watch_music_channels.is_running():
+        watch_music_channels.start()
+
+    if not save_playback_positions_task.is_running():
+        save_playback_positions_task.start()
+
+    cluster.start()
+    await cluster.send_guild_count()
+
+    music = bot.get_cog("Music")
+    if music:
+        await music.resume_saved()
+
+@bot.event
+async def on_guild_join(guild):
+    await cluster.send_guild_count()
+
+@bot.event
+async def on_guild_remove(guild):
+    await cluster.send_guild_count()
+
 async def main():
+    loop_monitor.start()
+    metrics_runner = await start_metrics_server()
+    extractor.start()
+    await queue_store.load()
     async with bot:
+        bot.add_dynamic_items(PlayerButton, QueuePageButton)
         await bot.add_cog(Music(bot))
-        await bot.start(TOKEN)
-
-asyncio.run(main())
+        try:
+            await bot.start(TOKEN)
+        finally:
+            # cog_unload (마지막 재생 위치 저장) 이 저장소를 닫기 전에 돌도록 먼저 종료
+            await bot.close()
+            await music_channels.flush()
+            await queue_store.close()
+            extractor.shutdown()
+            metadata_resolver.shutdown()
+            if metrics_runner:
+                await metrics_runner.cleanup()
+
+# process 모드의 워커(spawn)가 이 파일을 import 해도 봇이 뜨지 않도록
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -3,8 +3,20 @@ from dotenv import load_dotenv
 import discord
 from discord.ext import commands, tasks
 import asyncio
+import time
+import sqlite3
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
+from functools import lru_cache
+from itertools import islice
 import json
+import re
+from bisect import bisect_left
+import aiohttp
+from aiohttp import web
 import wavelink
+from urllib.parse import urlparse
 
 # =========================
 # 
@@ -45,25 +57,422 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.voice_states = True
 
+# =========================
+# 메트릭 (핫패스에서는 숫자만 올리고, 합산은 /metrics 요청 때)
+# =========================
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SEARCH_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUEUE_DEPTH_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels=""):
+        sep = "," if labels else ""
+        suffix = f"{{{labels}}}" if labels else ""
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {total}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+# REST 경로의 ID/토큰을 지워 라우트 단위로 묶음
+# 예) /api/v10/channels/123.../messages/456... → /channels/:id/messages/:id
+_ROUTE_VERSION = re.compile(r"^/api/v\d+")
+_ROUTE_ID = re.compile(r"/\d{15,21}(?=/|$)")
+_ROUTE_TOKEN = re.compile(r"(/(?:webhooks|interactions)/:id)/[^/]+")
+_ROUTE_REACTION = re.compile(r"(/reactions)/[^/]+")
+
+# 같은 경로가 계속 들어오므로 정리 결과를 캐시 (크기 제한)
+@lru_cache(maxsize=4096)
+def rest_route(path):
+    path = _ROUTE_VERSION.sub("", path)
+    path = _ROUTE_ID.sub("/:id", path)
+    path = _ROUTE_TOKEN.sub(r"\1/:token", path)
+    return _ROUTE_REACTION.sub(r"\1/:emoji", path)
+
+class RestStats:
+    def __init__(self):
+        self.calls = {}         # (method, route) -> 횟수
+        self.rate_limited = {}  # (method, route) -> 429 횟수
+        self.trace = aiohttp.TraceConfig()
+        self.trace.on_request_end.append(self._on_request_end)
+
+    async def _on_request_end(self, session, ctx, params):
+        path = params.url.path
+        if not path.startswith("/api/"):  # 게이트웨이/음성 웹소켓 제외
+            return
+
+        # id 가 들어간 원래 경로로 세면 키가 끝없이 늘어나므로 라우트로 정리해서 셈
+        key = (params.method, rest_route(path))
+        self.calls[key] = self.calls.get(key, 0) + 1
+        if params.response.status == 429:
+            self.rate_limited[key] = self.rate_limited.get(key, 0) + 1
+
+rest_stats = RestStats()
+
+# =========================
+# Lavalink 노드 설정 / 부하 기반 선택
+# =========================
+LAVALINK_NODES_FILE = os.getenv("LAVALINK_NODES_FILE", "lavalink_nodes.json")
+NODE_STATS_INTERVAL = 15        # 노드 상태 정리 / 재배치 주기(초)
+NODE_STATS_MAX_AGE = 150        # Lavalink 는 60초마다 stats 를 보냄, 이보다 오래되면 버림
+NODE_DEGRADED_PENALTY = 400     # 이 값을 넘으면 과부하 노드로 판단
+NODE_MOVE_MARGIN = 100          # 옮길 노드가 이만큼 여유 있을 때만 이동
+
+def load_lavalink_nodes():
+    # {"nodes": [{"identifier": "main", "uri": "http://...", "password": "..."}]}
+    try:
+        with open(LAVALINK_NODES_FILE, "r", encoding="utf-8") as f:
+            configs = json.load(f).get("nodes", [])
+    except FileNotFoundError:
+        configs = []
+
+    if not configs:
+        configs = [{
+            "identifier": "local",
+            "uri": "http://127.0.0.1:2333",
+            "password": "youshallnotpass"
+        }]
+
+    return [
+        wavelink.Node(
+            identifier=c.get("identifier"),
+            uri=c["uri"],
+            password=c["password"]
+        )
+        for c in configs
+    ]
+
+def node_penalty(stats):
+    # Lavalink 클라이언트들이 쓰는 부하 점수 (낮을수록 여유)
+    if stats is None:
+        return float("inf")
+
+    penalty = stats.playing + (stats.players - stats.playing) * 0.25
+    penalty += 1.05 ** (100 * stats.cpu.system_load) * 10 - 10
+
+    if stats.frames:
+        # 프레임 통계는 1분(3000프레임) 기준
+        penalty += 1.03 ** (500 * stats.frames.deficit / 3000) * 600 - 600
+        penalty += (1.03 ** (500 * stats.frames.nulled / 3000) * 300 - 300) * 2
+
+    return penalty
+
+class NodeBalancer:
+    def __init__(self):
+        self.stats = {}  # identifier -> (받은 시각, StatsEventPayload)
+
+    def connected_nodes(self):
+        return [
+            node for node in wavelink.Pool.nodes.values()
+            if node.status is wavelink.NodeStatus.CONNECTED
+        ]
+
+    def penalty(self, node):
+        if node.status is not wavelink.NodeStatus.CONNECTED:
+            return float("inf")
+
+        entry = self.stats.get(node.identifier)
+        if entry is None:
+            return float("inf")
+
+        stats = entry[1]
+        # 마지막 stats 이후에 이 노드에 새로 만든 플레이어는 아직 반영 안 됐으므로 더해 줌
+        pending = max(0, len(node.players) - stats.players)
+        return node_penalty(stats) + pending
+
+    def best_node(self, exclude=None):
+        nodes = [n for n in self.connected_nodes() if n is not exclude]
+        if not nodes:
+            return wavelink.Pool.get_node()
+
+        # 아직 상태를 못 받은 노드는 플레이어 수로만 비교
+        return min(
+            nodes,
+            key=lambda n: (self.penalty(n), len(n.players))
+        )
+
+    def record_stats(self, payload):
+        # REST /v4/stats 는 frameStats 가 항상 null 이라 웹소켓 stats 를 사용
+        # 이벤트에 노드 정보가 없으므로 보낸 웹소켓의 keep_alive 태스크로 노드를 찾음
+        task = asyncio.current_task()
+        for node in wavelink.Pool.nodes.values():
+            websocket = node._websocket
+            if websocket is not None and websocket.keep_alive_task is task:
+                self.stats[node.identifier] = (time.monotonic(), payload)
+                return
+
+    def prune(self):
+        now = time.monotonic()
+        for node in wavelink.Pool.nodes.values():
+            entry = self.stats.get(node.identifier)
+            if node.status is not wavelink.NodeStatus.CONNECTED or (
+                entry and now - entry[0] > NODE_STATS_MAX_AGE
+            ):
+                self.stats.pop(node.identifier, None)
+
+    async def move_player(self, player, node):
+        # wavelink 3.4 에는 노드 전환 API 가 없어서 직접 옮김
+        guild_id = player.guild.id
+        track = player.current
+        position = player.position
+        paused = player.paused
+        old = player.node
+
+        # 이전 노드에서 먼저 빼야 destroy 이벤트가 재생 루프로 전달되지 않음
+        old._players.pop(guild_id, None)
+        try:
+            await old._destroy_player(guild_id)
+        except Exception:
+            pass
+
+        player._node = node
+        node._players[guild_id] = player
+        await player._dispatch_voice_update()
+
+        if track:
+            await player.play(track, start=position, paused=paused)
+
+    async def rebalance(self):
+        for node in list(wavelink.Pool.nodes.values()):
+            penalty = self.penalty(node)
+            if penalty < NODE_DEGRADED_PENALTY or not node.players:
+                continue
+
+            target = self.best_node(exclude=node)
+            if target is node or self.penalty(target) + NODE_MOVE_MARGIN > penalty:
+                continue
+
+            for player in list(node.players.values()):
+                try:
+                    await self.move_player(player, target)
+                except Exception as e:
+                    print(f"플레이어 노드 이동 실패 ({node.identifier} → {target.identifier}): {e}")
+
+node_balancer = NodeBalancer()
+
+# =========================
+# Single-flight (같은 요청 합치기)
+# =========================
+class SingleFlight:
+    def __init__(self):
+        self.inflight = {}
+        self.calls = 0      # 실제로 실행된 횟수
+        self.collapsed = 0  # 진행 중인 요청에 합쳐진 횟수
+
+    def _done(self, key, task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+
+        # 기다리던 쪽이 모두 취소됐어도 예외 경고가 남지 않도록
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, func):
+        task = self.inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = self.inflight[key] = asyncio.create_task(func())
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.collapsed += 1
+
+        # 한 요청자가 취소돼도 다른 요청자를 위해 작업은 계속
+        return await asyncio.shield(task)
+
+# =========================
+# Lavalink 검색 캐시 (LRU + TTL + 디스크)
+# =========================
+# 빈 값으로 두면 디스크에 저장하지 않고 메모리 캐시만 씀
+SEARCH_CACHE_FILE = os.getenv("SEARCH_CACHE_FILE", "search_cache.json")
+SEARCH_CACHE_SIZE = 2048
+SEARCH_CACHE_TTL = 6 * 60 * 60  # 초
+SEARCH_CACHE_TRACKS = 1         # 검색 결과 중 저장할 곡 수 (재생에는 첫 곡만 사용)
+SEARCH_CACHE_SAVE_INTERVAL = 5  # 디스크 저장 주기(분)
+
+def search_cache_key(query, source):
+    query = query.strip()
+    parsed = urlparse(query)
+    if not (parsed.scheme and parsed.netloc):
+        # URL 은 대소문자가 의미 있으므로 일반 검색어만 정규화
+        query = " ".join(query.lower().split())
+
+    if isinstance(source, wavelink.TrackSource):
+        source = source.name
+    return f"{source or ''}|{query}"
+
+def compact_track(track):
+    # Playable 객체 대신 encoded 문자열 + 기본 정보만 저장
+    data = track.raw_data
+    return {"encoded": data["encoded"], "info": data["info"]}
+
+def restore_track(data):
+    return wavelink.Playable({
+        "encoded": data["encoded"],
+        "info": data["info"],
+        "pluginInfo": {},
+        "userData": {}
+    })
+
+def save_search_cache(path, payload):
+    # 임시 파일 이름은 매번 새로 (저장이 겹쳐도 서로의 임시 파일을 덮어쓰지 않게)
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f"{os.path.basename(path)}.",
+        suffix=".tmp",
+        dir=os.path.dirname(os.path.abspath(path))
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+class SearchCache:
+    def __init__(self, path=SEARCH_CACHE_FILE, max_size=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.flight = SingleFlight()
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.latency = Histogram(SEARCH_BUCKETS)
+
+    def _get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, tracks = entry
+        if expires_at <= time.time():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return tracks
+
+    def _put(self, key, tracks, expires_at=None):
+        self.entries[key] = (expires_at or time.time() + self.ttl, tracks)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        self.dirty = True
+
+    async def _fetch(self, key, query, source, node):
+        started = time.perf_counter()
+        result = await wavelink.Playable.search(query, source=source, node=node)
+        self.latency.observe(time.perf_counter() - started)
+
+        # 플레이리스트는 캐시하지 않고 그대로 돌려줌
+        if isinstance(result, wavelink.Playlist):
+            return result
+
+        tracks = [compact_track(t) for t in result[:SEARCH_CACHE_TRACKS]]
+        if tracks:
+            self._put(key, tracks)
+        return tracks
+
+    async def search(self, query, *, source, node=None):
+        key = search_cache_key(query, source)
+
+        tracks = self._get(key)
+        if tracks is not None:
+            self.hits += 1
+            return [restore_track(t) for t in tracks]
+
+        # 같은 검색이 이미 진행 중이면 그 결과를 같이 기다림
+        self.misses += 1
+        result = await self.flight.do(
+            key,
+            lambda: self._fetch(key, query, source, node)
+        )
+        if isinstance(result, wavelink.Playlist):
+            return result
+        return [restore_track(t) for t in result]
+
+    # =========================
+    # 디스크 저장 / 불러오기
+    # =========================
+    def load(self):
+        if not self.path:
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+
+        now = time.time()
+        for key, expires_at, tracks in saved.get("entries", []):
+            if expires_at > now:
+                self.entries[key] = (expires_at, tracks)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def save(self):
+        if not self.path or not self.dirty:
+            return
+
+        self.dirty = False
+        payload = {
+            "entries": [
+                [key, expires_at, tracks]
+                for key, (expires_at, tracks) in self.entries.items()
+            ]
+        }
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, save_search_cache, self.path, payload)
+        except OSError as e:
+            self.dirty = True
+            print(f"검색 캐시 저장 실패: {e}")
+
+search_cache = SearchCache()
+
 # =========================
 # Bot
 # =========================
 class MyBot(commands.Bot):
+    def dispatch(self, event_name, /, *args, **kwargs):
+        if event_name == "wavelink_stats_update":
+            node_balancer.record_stats(*args)
+        super().dispatch(event_name, *args, **kwargs)
+
     async def setup_hook(self):
         await wavelink.Pool.connect(
             client=self,
-            nodes=[
-                wavelink.Node(
-                    uri="http://127.0.0.1:2333",
-                    password="youshallnotpass"
-                )
-            ]
+            nodes=load_lavalink_nodes()
         )
 
 bot = MyBot(
     command_prefix="!",
     intents=intents,
-    help_command=None
+    help_command=None,
+    http_trace=rest_stats.trace
 )
 
 # =========================
@@ -78,6 +487,341 @@ async def update_server_count():
         )
     )
 
+# =========================
+# Guild Queue
+# =========================
+QUEUE_MAX_SIZE = 500  # 서버당 최대 대기곡 수
+QUEUE_USER_LIMIT = 50  # 한 사람이 넣을 수 있는 최대 대기곡 수 (0 이면 제한 없음)
+PLAYLIST_USER_LIMIT = QUEUE_MAX_SIZE  # 플레이리스트로 넣을 때는 서버 한도까지 (500곡짜리도 한 번에)
+
+class QueueFull(Exception):
+    pass
+
+class QueueEntry:
+    # Member/Channel 객체 대신 ID 만 저장 → 재생 시점에 캐시에서 다시 찾음
+    __slots__ = ("guild_id", "channel_id", "requester_id", "query", "track", "entry_id", "start")
+
+    def __init__(self, guild_id, channel_id, requester_id, query):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.requester_id = requester_id
+        self.query = query
+        self.track = None  # 이미 찾은 wavelink.Playable
+        self.entry_id = None  # 저장용 순번
+        self.start = 0        # 이어서 재생할 위치(초)
+
+class GuildQueue:
+    def __init__(self, guild_id=None, store=None, max_size=QUEUE_MAX_SIZE, user_limit=QUEUE_USER_LIMIT,
+                 playlist_limit=PLAYLIST_USER_LIMIT):
+        self.guild_id = guild_id
+        self.store = store
+        self.entries = deque()
+        self.max_size = max_size
+        self.user_limit = user_limit
+        self.playlist_limit = playlist_limit
+        self.user_counts = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __getitem__(self, index):
+        return self.entries[index]
+
+    def _check(self, requester_id, count=1, user_limit=None):
+        if len(self.entries) + count > self.max_size:
+            raise QueueFull(f"대기열이 가득 찼습니다. (최대 {self.max_size}곡)")
+
+        if user_limit is None:
+            user_limit = self.user_limit
+        if user_limit and self.user_counts.get(requester_id, 0) + count > user_limit:
+            raise QueueFull(f"한 사람당 최대 {user_limit}곡까지 추가할 수 있습니다.")
+
+    def _count(self, entry, delta):
+        requester_id = entry.requester_id
+        count = self.user_counts.get(requester_id, 0) + delta
+        if count > 0:
+            self.user_counts[requester_id] = count
+        else:
+            self.user_counts.pop(requester_id, None)
+
+    def push(self, entry, user_limit=None):
+        self._check(entry.requester_id, user_limit=user_limit)
+        self.entries.append(entry)
+        self._count(entry, 1)
+
+        if self.store:
+            entry.entry_id = self.store.new_id(entry.guild_id)
+            self.store.pushed(entry)
+
+    def restore(self, entries):
+        # 저장돼 있던 대기열 복구 (제한 검사/저장 없이)
+        for entry in entries:
+            self.entries.append(entry)
+            self._count(entry, 1)
+
+    def extend(self, entries):
+        # 플레이리스트용: 들어갈 수 있는 만큼만 넣고 넣은 개수를 돌려줌
+        added = 0
+        for entry in entries:
+            try:
+                self.push(entry, user_limit=self.playlist_limit)
+            except QueueFull:
+                break
+            added += 1
+        return added
+
+    def popleft(self):
+        entry = self.entries.popleft()
+        self._count(entry, -1)
+        if self.store:
+            self.store.popped(entry)
+        return entry
+
+    def remove_at(self, index):
+        entry = self.entries[index]
+        del self.entries[index]
+        self._count(entry, -1)
+        if self.store:
+            self.store.popped(entry)
+        return entry
+
+    def head(self, count):
+        return list(islice(self.entries, count))
+
+    def snapshot(self):
+        return tuple(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.user_counts.clear()
+        if self.store:
+            self.store.cleared(self.guild_id)
+
+# =========================
+# 검색 캐시 저장
+# =========================
+@tasks.loop(minutes=SEARCH_CACHE_SAVE_INTERVAL)
+async def save_search_cache_task():
+    await search_cache.save()
+
+# =========================
+# Lavalink 노드 상태 정리 / 재배치
+# =========================
+@tasks.loop(seconds=NODE_STATS_INTERVAL)
+async def poll_lavalink_nodes():
+    node_balancer.prune()
+    await node_balancer.rebalance()
+
+# =========================
+# 대기열 저장 / 재시작 후 이어서 재생 (SQLite)
+# =========================
+# safe14.py 와 같은 폴더에서 돌려도 서로의 대기열을 건드리지 않도록 파일을 따로 씀
+STATE_DB = os.getenv("LAVA_STATE_DB", "lava_state.db")
+STATE_FLUSH_DELAY = 0.5       # 변경 사항을 모아서 저장하는 간격(초)
+POSITION_SAVE_INTERVAL = 10   # 재생 위치 저장 주기(초)
+
+class SavedPlayback:
+    __slots__ = ("guild_id", "voice_channel_id", "channel_id", "requester_id", "query", "position")
+
+    def __init__(self, guild_id, voice_channel_id, channel_id, requester_id, query, position):
+        self.guild_id = guild_id
+        self.voice_channel_id = voice_channel_id
+        self.channel_id = channel_id
+        self.requester_id = requester_id
+        self.query = query
+        self.position = position
+
+class QueueStore:
+    def __init__(self, path=STATE_DB):
+        self.path = path
+        self.conn = None
+        # sqlite 연결은 항상 같은 스레드 하나에서만 사용
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-db")
+        self.ops = []
+        self.flush_handle = None
+        self.lock = asyncio.Lock()
+        self.next_ids = {}  # guild_id → 다음 순번
+        self.frozen = False
+        self.saved_queues = {}
+        self.saved_playback = {}
+
+    # ---- executor 스레드에서 실행 ----
+    def _open(self):
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # 순번은 서버(guild)별로 매김
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS queue_entries ("
+            " guild_id INTEGER NOT NULL,"
+            " entry_id INTEGER NOT NULL,"
+            " channel_id INTEGER,"
+            " requester_id INTEGER,"
+            " query TEXT NOT NULL,"
+            " PRIMARY KEY (guild_id, entry_id))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS playback ("
+            " guild_id INTEGER PRIMARY KEY,"
+            " voice_channel_id INTEGER,"
+            " channel_id INTEGER,"
+            " requester_id INTEGER,"
+            " query TEXT NOT NULL,"
+            " position REAL NOT NULL DEFAULT 0)"
+        )
+        self.conn.commit()
+
+    def _load(self):
+        if self.conn is None:
+            self._open()
+
+        queues = {}
+        for entry_id, guild_id, channel_id, requester_id, query in self.conn.execute(
+            "SELECT entry_id, guild_id, channel_id, requester_id, query"
+            " FROM queue_entries ORDER BY guild_id, entry_id"
+        ):
+            entry = QueueEntry(guild_id, channel_id, requester_id, query)
+            entry.entry_id = entry_id
+            queues.setdefault(guild_id, []).append(entry)
+
+        playback = {
+            row[0]: SavedPlayback(*row)
+            for row in self.conn.execute(
+                "SELECT guild_id, voice_channel_id, channel_id, requester_id, query, position"
+                " FROM playback"
+            )
+        }
+
+        return queues, playback
+
+    def _apply(self, ops):
+        if self.conn is None:
+            self._open()
+
+        with self.conn:
+            for op, *args in ops:
+                if op == "push":
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO queue_entries"
+                        " (guild_id, entry_id, channel_id, requester_id, query)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        args
+                    )
+                elif op == "pop":
+                    self.conn.execute("DELETE FROM queue_entries WHERE guild_id = ? AND entry_id = ?", args)
+                elif op == "clear":
+                    self.conn.execute("DELETE FROM queue_entries WHERE guild_id = ?", args)
+                elif op == "playing":
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO playback"
+                        " (guild_id, voice_channel_id, channel_id, requester_id, query, position)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        args
+                    )
+                elif op == "position":
+                    self.conn.execute("UPDATE playback SET position = ? WHERE guild_id = ?", args)
+                elif op == "stopped":
+                    self.conn.execute("DELETE FROM playback WHERE guild_id = ?", args)
+
+    def _close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    # ---- event loop 쪽 ----
+    async def load(self):
+        loop = asyncio.get_running_loop()
+        self.saved_queues, self.saved_playback = await loop.run_in_executor(
+            self.executor, self._load
+        )
+        self.next_ids = {
+            guild_id: entries[-1].entry_id + 1
+            for guild_id, entries in self.saved_queues.items()
+        }
+
+    def take_saved(self):
+        saved = self.saved_queues, self.saved_playback
+        self.saved_queues, self.saved_playback = {}, {}
+        return saved
+
+    def new_id(self, guild_id):
+        entry_id = self.next_ids.get(guild_id, 1)
+        self.next_ids[guild_id] = entry_id + 1
+        return entry_id
+
+    # 변경 기록은 바로 반환하고, 저장은 모아서 나중에
+    def _record(self, op):
+        if self.frozen:
+            return
+
+        self.ops.append(op)
+        if self.flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self.flush_handle = loop.call_later(
+                STATE_FLUSH_DELAY,
+                lambda: asyncio.create_task(self.flush())
+            )
+
+    def pushed(self, entry):
+        self._record(("push", entry.guild_id, entry.entry_id, entry.channel_id, entry.requester_id, entry.query))
+
+    def popped(self, entry):
+        self._record(("pop", entry.guild_id, entry.entry_id))
+
+    def cleared(self, guild_id):
+        self._record(("clear", guild_id))
+
+    def playing(self, guild_id, voice_channel_id, entry):
+        self._record(("playing", guild_id, voice_channel_id, entry.channel_id, entry.requester_id, entry.query, entry.start))
+
+    def position(self, guild_id, position):
+        self._record(("position", position, guild_id))
+
+    def stopped(self, guild_id):
+        self._record(("stopped", guild_id))
+
+    def freeze(self):
+        # 종료 중에는 음성 연결이 끊기면서 생기는 변경을 저장하지 않음
+        self.frozen = True
+
+    async def flush(self):
+        if self.flush_handle:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        async with self.lock:
+            ops, self.ops = self.ops, []
+            if not ops:
+                return
+
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(self.executor, self._apply, ops)
+            except sqlite3.Error as e:
+                print(f"대기열 저장 실패: {e}")
+
+    async def close(self):
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._close)
+        self.executor.shutdown(wait=False)
+
+queue_store = QueueStore()
+
+# =========================
+# 재생 위치 저장 (Lavalink 가 알려주는 위치 기준)
+# =========================
+def save_playback_positions():
+    for player in bot.voice_clients:
+        if isinstance(player, wavelink.Player) and player.current:
+            queue_store.position(player.guild.id, player.position / 1000)
+
+@tasks.loop(seconds=POSITION_SAVE_INTERVAL)
+async def save_playback_positions_task():
+    save_playback_positions()
+
 # =========================
 # Button Control
 # =========================
@@ -108,9 +852,57 @@ class Music(commands.Cog):
         self.queues = {}
         self.play_tasks = {}
         self.now_playing_message = {}
+        self.track_end_events = {}
 
     def get_queue(self, guild_id):
-        return self.queues.setdefault(guild_id, [])
+        queue = self.queues.get(guild_id)
+        if queue is None:
+            queue = self.queues[guild_id] = GuildQueue(guild_id, queue_store)
+        return queue
+
+    def clear_queue(self, guild_id):
+        self.get_queue(guild_id).clear()
+        queue_store.stopped(guild_id)
+
+    # =========================
+    # 재시작 후 이어서 재생
+    # =========================
+    async def resume_saved(self):
+        saved_queues, saved_playback = queue_store.take_saved()
+
+        for guild_id in set(saved_queues) | set(saved_playback):
+            guild = self.bot.get_guild(guild_id)
+            if guild is None:
+                continue
+
+            current = saved_playback.get(guild_id)
+            voice_channel = guild.get_channel(current.voice_channel_id) if current else None
+            if not voice_channel or not any(not m.bot for m in voice_channel.members):
+                self.clear_queue(guild_id)
+                continue
+
+            entries = saved_queues.get(guild_id, [])
+            entry = QueueEntry(guild_id, current.channel_id, current.requester_id, current.query)
+            entry.start = current.position
+            self.get_queue(guild_id).restore([entry, *entries])
+
+            try:
+                if not guild.voice_client:
+                    await voice_channel.connect(
+                        cls=wavelink.Player(nodes=[node_balancer.best_node()])
+                    )
+            except (discord.ClientException, wavelink.WavelinkException, asyncio.TimeoutError):
+                self.clear_queue(guild_id)
+                continue
+
+            if guild_id not in self.play_tasks:
+                self.play_tasks[guild_id] = asyncio.create_task(
+                    self.player_loop(guild_id)
+                )
+
+    async def cog_unload(self):
+        save_playback_positions()
+        queue_store.freeze()
 
     # =========================
     # Voice Channel Check
@@ -144,10 +936,11 @@ class Music(commands.Cog):
             inline=True
         )
 
-        embed.set_footer(
-            text=requester.display_name,
-            icon_url=requester.display_avatar.url
-        )
+        if requester:
+            embed.set_footer(
+                text=requester.display_name,
+                icon_url=requester.display_avatar.url
+            )
 
         return embed
 
@@ -174,46 +967,100 @@ class Music(commands.Cog):
                 if not queue:
                     break
 
-                item = queue.pop(0)
+                item = queue.popleft()
 
                 player: wavelink.Player = guild.voice_client
                 if not player or not player.connected:
                     break
 
-                tracks = await wavelink.Playable.search(
-                    item["query"],
-                    source=wavelink.TrackSource.SoundCloud,
-                    node=wavelink.Pool.get_node()
-                )
-
-                if not tracks:
-                    continue
-
-                track = tracks[0]
+                # 플레이리스트로 들어온 곡은 이미 찾은 트랙을 그대로 사용
+                track, item.track = item.track, None
+                if track is None:
+                    try:
+                        tracks = await search_cache.search(
+                            item.query,
+                            source=wavelink.TrackSource.SoundCloud,
+                            node=node_balancer.best_node()
+                        )
+                    except wavelink.LavalinkLoadException as e:
+                        # 곡 하나가 실패해도 다음 곡으로
+                        print(f"곡 검색 실패, 건너뜀: {item.query} ({e})")
+                        continue
+
+                    if not tracks or isinstance(tracks, wavelink.Playlist):
+                        continue
+
+                    track = tracks[0]
 
                 embed = self.build_now_playing_embed(
                     track,
-                    item["requester"]
+                    guild.get_member(item.requester_id)
                 )
 
                 await self.cleanup_now_playing(guild_id)
 
-                text_channel = item["channel"]
-                msg = await text_channel.send(
-                    embed=embed,
-                    view=PlayerControls(player)
-                )
-                self.now_playing_message[guild_id] = msg
+                text_channel = guild.get_channel_or_thread(item.channel_id)
+                if text_channel:
+                    msg = await text_channel.send(
+                        embed=embed,
+                        view=PlayerControls(player)
+                    )
+                    self.now_playing_message[guild_id] = msg
+
+                done = asyncio.Event()
+                self.track_end_events[guild_id] = done
 
-                await player.play(track)
+                await player.play(track, start=int(item.start * 1000))
+                queue_store.playing(guild_id, player.channel.id, item)
+                await done.wait()
 
-                while player.playing:
-                    await asyncio.sleep(0.5)
+            queue_store.stopped(guild_id)
 
         except asyncio.CancelledError:
             pass
         finally:
             self.play_tasks.pop(guild_id, None)
+            self.track_end_events.pop(guild_id, None)
+
+    # =========================
+    # Track end (재생 완료 이벤트)
+    # =========================
+    def signal_track_end(self, player):
+        if not player or not player.guild:
+            return
+
+        done = self.track_end_events.get(player.guild.id)
+        if done:
+            done.set()
+
+    @commands.Cog.listener()
+    async def on_wavelink_track_end(self, payload: wavelink.TrackEndEventPayload):
+        # replaced 는 새 곡이 이전 곡을 대체한 경우라 다음 곡 대기를 끝내면 안 됨
+        if payload.reason == "replaced":
+            return
+
+        self.signal_track_end(payload.player)
+
+    @commands.Cog.listener()
+    async def on_wavelink_websocket_closed(self, payload: wavelink.WebsocketClosedEventPayload):
+        self.signal_track_end(payload.player)
+
+    # =========================
+    # Playlist Import
+    # =========================
+    async def import_playlist(self, ctx, playlist):
+        # Lavalink 가 목록을 한 번에 돌려주므로 트랙을 붙여서 바로 대기열에 넣음
+        entries = []
+        for track in playlist.tracks:
+            entry = QueueEntry(ctx.guild.id, ctx.channel.id, ctx.author.id, track.uri or track.title)
+            entry.track = track
+            entries.append(entry)
+
+        added = self.get_queue(ctx.guild.id).extend(entries)
+        if added < len(entries):
+            await ctx.send("⚠️ 대기열 제한에 걸려 나머지 곡은 추가하지 않았습니다.", delete_after=10)
+        if added:
+            await ctx.send(f"📃 플레이리스트 **{playlist.name}** 에서 {added}곡을 추가했습니다.", delete_after=10)
 
     # =========================
     # Commands
@@ -229,13 +1076,41 @@ class Music(commands.Cog):
             return
 
         if not ctx.voice_client:
-            await ctx.author.voice.channel.connect(cls=wavelink.Player)
+            await ctx.author.voice.channel.connect(
+                cls=wavelink.Player(nodes=[node_balancer.best_node()])
+            )
+
+        # URL 이면 먼저 불러와서 플레이리스트인지 확인 (결과는 검색 캐시에 남음)
+        if urlparse(query).scheme in ("http", "https"):
+            try:
+                result = await search_cache.search(
+                    query,
+                    source=wavelink.TrackSource.SoundCloud,
+                    node=node_balancer.best_node()
+                )
+            except wavelink.LavalinkLoadException:
+                result = None
+
+            if isinstance(result, wavelink.Playlist):
+                await self.import_playlist(ctx, result)
+                if ctx.guild.id not in self.play_tasks:
+                    self.play_tasks[ctx.guild.id] = asyncio.create_task(
+                        self.player_loop(ctx.guild.id)
+                    )
+                return
 
-        self.get_queue(ctx.guild.id).append({
-            "query": query,
-            "requester": ctx.author,
-            "channel": ctx.channel
-        })
+        try:
+            self.get_queue(ctx.guild.id).push(
+                QueueEntry(
+                    ctx.guild.id,
+                    ctx.channel.id,
+                    ctx.author.id,
+                    query
+                )
+            )
+        except QueueFull as e:
+            await ctx.send(f"❌ {e}", delete_after=10)
+            return
 
         if ctx.guild.id not in self.play_tasks:
             self.play_tasks[ctx.guild.id] = asyncio.create_task(
@@ -255,10 +1130,10 @@ class Music(commands.Cog):
         if not queue:
             embed.description = "📭 현재 대기중인 곡이 없습니다."
         else:
-            for idx, item in enumerate(queue, start=1):
+            for idx, item in enumerate(queue.snapshot(), start=1):
                 embed.add_field(
-                    name=f"{idx}️⃣ {item['query']}",
-                    value=item["requester"].display_name,
+                    name=f"{idx}️⃣ {item.query}",
+                    value=f"<@{item.requester_id}>",
                     inline=False
                 )
 
@@ -276,7 +1151,7 @@ class Music(commands.Cog):
             return
 
         await player.stop()
-        self.get_queue(ctx.guild.id).clear()
+        self.clear_queue(ctx.guild.id)
 
         task = self.play_tasks.pop(ctx.guild.id, None)
         if task:
@@ -297,7 +1172,9 @@ class Music(commands.Cog):
         if ctx.voice_client and ctx.voice_client.connected:
             return
 
-        await ctx.author.voice.channel.connect(cls=wavelink.Player)
+        await ctx.author.voice.channel.connect(
+            cls=wavelink.Player(nodes=[node_balancer.best_node()])
+        )
 
     @commands.command()
     async def leave(self, ctx):
@@ -312,7 +1189,7 @@ class Music(commands.Cog):
 
         await player.disconnect()
 
-        self.get_queue(ctx.guild.id).clear()
+        self.clear_queue(ctx.guild.id)
         task = self.play_tasks.pop(ctx.guild.id, None)
         if task:
             task.cancel()
@@ -403,7 +1280,7 @@ class Music(commands.Cog):
                 humans = [m for m in before.channel.members if not m.bot]
                 if not humans:
                     await player.disconnect()
-                    self.get_queue(member.guild.id).clear()
+                    self.clear_queue(member.guild.id)
 
                     task = self.play_tasks.pop(member.guild.id, None)
                     if task:
@@ -411,6 +1288,101 @@ class Music(commands.Cog):
 
                     await self.cleanup_now_playing(member.guild.id)
 
+# =========================
+# Event loop 지연 측정
+# =========================
+LOOP_MONITOR_INTERVAL = 0.05
+
+class LoopMonitor:
+    def __init__(self):
+        self.lag = Histogram(LAG_BUCKETS)
+        self.max_lag = 0.0
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + LOOP_MONITOR_INTERVAL
+            await asyncio.sleep(LOOP_MONITOR_INTERVAL)
+
+            lag = max(0.0, time.perf_counter() - expected)
+            self.lag.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+loop_monitor = LoopMonitor()
+
+# =========================
+# 메트릭 엔드포인트 (METRICS_PORT 를 지정했을 때만)
+# =========================
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+def counter_lines(name, counts, label_names):
+    return [
+        name + "{" + ",".join(f'{label}="{value}"' for label, value in zip(label_names, key)) + "}" + f" {count}"
+        for key, count in sorted(counts.items())
+    ]
+
+def render_metrics():
+    # 수집은 전부 여기서 (요청이 올 때만 계산)
+    lines = loop_monitor.lag.render("bot_event_loop_lag_seconds")
+    lines.append(f"bot_event_loop_lag_max_seconds {loop_monitor.max_lag}")
+
+    latency = bot.latency
+    if latency == latency and latency != float("inf"):  # 연결 전에는 nan/inf
+        lines.append(f"discord_gateway_latency_seconds {latency}")
+
+    # 샤드별 음성 연결 수
+    voice = {}
+    for vc in bot.voice_clients:
+        shard_id = vc.guild.shard_id
+        voice[shard_id] = voice.get(shard_id, 0) + 1
+    for shard_id, count in sorted(voice.items()):
+        lines.append(f'bot_voice_connections{{shard="{shard_id}"}} {count}')
+
+    # 대기열 길이 분포
+    music = bot.get_cog("Music")
+    if music:
+        depth = Histogram(QUEUE_DEPTH_BUCKETS)
+        for queue in list(music.queues.values()):
+            depth.observe(len(queue))
+        lines += depth.render("bot_queue_depth")
+
+    # Lavalink 검색 / 캐시
+    lookups = search_cache.hits + search_cache.misses
+    lines += search_cache.latency.render("bot_lavalink_search_seconds")
+    lines.append(f"bot_search_cache_hits_total {search_cache.hits}")
+    lines.append(f"bot_search_cache_misses_total {search_cache.misses}")
+    lines.append(f"bot_search_cache_hit_ratio {search_cache.hits / lookups if lookups else 0.0}")
+    lines.append(f"bot_search_cache_entries {len(search_cache.entries)}")
+    lines.append(f"bot_search_collapsed_total {search_cache.flight.collapsed}")
+
+    # 디스코드 REST
+    lines += counter_lines(
+        "discord_rest_requests_total", rest_stats.calls, ("method", "route")
+    )
+    lines += counter_lines(
+        "discord_rest_429_total", rest_stats.rate_limited, ("method", "route")
+    )
+
+    return "\n".join(lines) + "\n"
+
+async def metrics_handler(request):
+    return web.Response(text=render_metrics(), content_type="text/plain")
+
+async def start_metrics_server():
+    if not METRICS_PORT:
+        return None
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    return runner
+
 # =========================
 # Run
 # =========================
@@ -422,9 +1394,35 @@ async def on_ready():
     if not update_server_count.is_running():
         update_server_count.start()
 
+    if not poll_lavalink_nodes.is_running():
+        poll_lavalink_nodes.start()
+
+    if search_cache.path and not save_search_cache_task.is_running():
+        save_search_cache_task.start()
+
+    if not save_playback_positions_task.is_running():
+        save_playback_positions_task.start()
+
+    music = bot.get_cog("Music")
+    if music:
+        await music.resume_saved()
+
 async def main():
+    loop_monitor.start()
+    metrics_runner = await start_metrics_server()
+    search_cache.load()
+    await queue_store.load()
     async with bot:
         await bot.add_cog(Music(bot))
-        await bot.start(TOKEN)
-
-asyncio.run(main())
+        try:
+            await bot.start(TOKEN)
+        finally:
+            # cog_unload (마지막 재생 위치 저장) 이 저장소를 닫기 전에 돌도록 먼저 종료
+            await bot.close()
+            await search_cache.save()
+            await queue_store.close()
+            if metrics_runner:
+                await metrics_runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
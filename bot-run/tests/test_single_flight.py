@@ -0,0 +1,54 @@
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import safe14
+import test2
+
+def test_concurrent_resolves_share_one_extraction(monkeypatch):
+    calls = []
+
+    async def fake_extract(query):
+        calls.append(query)
+        await asyncio.sleep(0.05)
+        return {"id": "dQw4w9WgXcQ", "extractor_key": "Youtube", "url": "https://example.invalid/a", "title": query}
+
+    monkeypatch.setattr(safe14.extractor, "extract", fake_extract)
+    monkeypatch.setattr(safe14, "track_cache", safe14.TrackCache())
+    monkeypatch.setattr(safe14, "resolve_flight", safe14.SingleFlight())
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*(
+            safe14.YTDLSource.resolve("Never Gonna Give You Up", loop=loop) for _ in range(100)
+        ))
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+    assert safe14.resolve_flight.calls == 1
+    assert safe14.resolve_flight.collapsed == 99
+
+def test_concurrent_searches_share_one_lavalink_call(monkeypatch):
+    calls = []
+
+    async def fake_search(query, *, source, node):
+        calls.append(query)
+        await asyncio.sleep(0.05)
+        return []
+
+    cache = test2.SearchCache(path=os.devnull)
+    monkeypatch.setattr(test2.wavelink.Playable, "search", fake_search)
+
+    async def run():
+        return await asyncio.gather(*(
+            cache.search("never gonna give you up", source=test2.wavelink.TrackSource.SoundCloud)
+            for _ in range(100)
+        ))
+
+    asyncio.run(run())
+
+    assert len(calls) == 1
+    assert cache.flight.collapsed == 99